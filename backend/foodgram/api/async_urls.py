@@ -0,0 +1,15 @@
+from django.urls import path
+
+from .async_views import (
+    IngredientDetail, IngredientList, RecipeDetail, RecipeList, TagDetail,
+    TagList, as_view
+)
+
+urlpatterns = [
+    path('recipes/', as_view(RecipeList)),
+    path('recipes/<int:pk>/', as_view(RecipeDetail)),
+    path('tags/', as_view(TagList)),
+    path('tags/<int:pk>/', as_view(TagDetail)),
+    path('ingredients/', as_view(IngredientList)),
+    path('ingredients/<int:pk>/', as_view(IngredientDetail)),
+]
@@ -0,0 +1,231 @@
+"""Асинхронные GET-вьюхи для ASGI.
+
+Чтение списков и отдельных рецептов, тегов и ингредиентов не занимает
+поток на время ожидания БД и медленного клиента. Вьюхи переиспользуют
+вьюсеты (queryset, фильтры, сериализаторы), а все остальные методы и
+курсорную пагинацию передают синхронным вьюсетам. Ответ всегда JSON."""
+from calendar import timegm
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from recipes.versions import INGREDIENTS, TAGS
+from .authentication import CachedTokenAuthentication
+from .conditional import (
+    catalog_etag, catalog_last_modified, recipe_etag, recipe_last_modified
+)
+from .paginators import CURSOR_MODE
+from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {
+    'get': 'retrieve', 'put': 'update',
+    'patch': 'partial_update', 'delete': 'destroy',
+}
+
+
+def render(data, status=200, headers=None):
+    response = HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+    )
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def error_response(exc):
+    if isinstance(exc, Http404):
+        exc = exceptions.NotFound()
+    if isinstance(exc, (exceptions.NotAuthenticated,
+                        exceptions.AuthenticationFailed)):
+        # Как APIView.handle_exception: заголовок схемы авторизации.
+        exc.auth_header = CachedTokenAuthentication().authenticate_header(
+            None
+        )
+    response = exception_handler(exc, {})
+    return render(response.data, response.status_code, {
+        name: value for name, value in response.headers.items()
+        if name in ('WWW-Authenticate', 'Retry-After')
+    })
+
+
+async def conditional(request, etag_func, last_modified_func, respond,
+                      **kwargs):
+    """Асинхронный аналог django.views.decorators.http.condition."""
+    etag, last_modified = await sync_to_async(lambda: (
+        quote_etag(etag_func(request, **kwargs)),
+        timegm(last_modified_func(request, **kwargs).utctimetuple()),
+    ))()
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified,
+    )
+    if response is None:
+        response = await respond()
+    if response.status_code in (200, 304):
+        response.headers.setdefault('Last-Modified', http_date(last_modified))
+        response.headers.setdefault('ETag', etag)
+    return response
+
+
+class AsyncReadView:
+    """GET обслуживается асинхронно, остальное - синхронным вьюсетом."""
+    viewset = None
+    basename = None
+    detail = False
+    paginated = False
+    vary = ()
+
+    def __init__(self):
+        actions = DETAIL_ACTIONS if self.detail else LIST_ACTIONS
+        self.actions = {
+            method: action for method, action in actions.items()
+            if hasattr(self.viewset, action)
+        }
+        self.sync_view = sync_to_async(self.viewset.as_view(
+            self.actions, basename=self.basename, detail=self.detail,
+        ))
+
+    def use_sync(self, request):
+        return (
+            request.method != 'GET'
+            or request.GET.get('pagination') == CURSOR_MODE
+        )
+
+    async def __call__(self, request, **kwargs):
+        if self.use_sync(request):
+            return await self.sync_view(request, **kwargs)
+        request = Request(request, authenticators=())
+        try:
+            user_auth = await CachedTokenAuthentication().aauthenticate(
+                request
+            )
+            if user_auth is not None:
+                request.user, request.auth = user_auth
+            view = self.viewset(
+                request=request, args=(), kwargs=kwargs, format_kwarg=None,
+                action='retrieve' if self.detail else 'list',
+            )
+            response = await self.respond(request, view, **kwargs)
+        except (exceptions.APIException, Http404) as exc:
+            return error_response(exc)
+        patch_vary_headers(response, self.vary)
+        return response
+
+    async def respond(self, request, view, **kwargs):
+        if self.detail:
+            return await self.retrieve(view, **kwargs)
+        return await self.list(view)
+
+    async def list(self, view):
+        queryset = await self.filter_queryset(view)
+        if not self.paginated:
+            # Поиск ингредиентов по индексу в памяти отдаёт готовый список.
+            objects = (queryset if isinstance(queryset, list)
+                       else [obj async for obj in queryset])
+            return render(view.get_serializer(objects, many=True).data)
+        paginator = view.paginator
+        page = await paginator.apaginate_queryset(
+            queryset, view.request, view
+        )
+        return render(paginator.get_paginated_response(
+            view.get_serializer(page, many=True).data
+        ).data)
+
+    async def filter_queryset(self, view):
+        # Фильтры могут читать справочники для проверки параметров.
+        return await sync_to_async(view.filter_queryset)(view.get_queryset())
+
+    async def retrieve(self, view, pk):
+        instance = await view.get_queryset().filter(pk=pk).afirst()
+        if instance is None:
+            raise exceptions.NotFound()
+        return render(await self.serialize(view, instance))
+
+    async def serialize(self, view, instance):
+        return view.get_serializer(instance).data
+
+
+class RecipeList(AsyncReadView):
+    viewset = RecipeViewSet
+    basename = 'recipes'
+    paginated = True
+
+
+class RecipeDetail(AsyncReadView):
+    viewset = RecipeViewSet
+    basename = 'recipes'
+    detail = True
+    vary = ('Authorization',)
+
+    async def respond(self, request, view, pk):
+        return await conditional(
+            request, recipe_etag, recipe_last_modified,
+            lambda: self.retrieve(view, pk), pk=pk,
+        )
+
+    async def serialize(self, view, instance):
+        # Сериализатор рецепта кэширует общую часть и при промахе
+        # догружает теги и ингредиенты.
+        return await sync_to_async(
+            lambda: view.get_serializer(instance).data
+        )()
+
+
+class CatalogView(AsyncReadView):
+    catalog = None
+
+    async def respond(self, request, view, **kwargs):
+        return await conditional(
+            request, catalog_etag(self.catalog),
+            catalog_last_modified(self.catalog),
+            lambda: super(CatalogView, self).respond(request, view, **kwargs),
+            **kwargs,
+        )
+
+
+class TagList(CatalogView):
+    viewset = TagViewSet
+    basename = 'tags'
+    catalog = TAGS
+
+
+class TagDetail(CatalogView):
+    viewset = TagViewSet
+    basename = 'tags'
+    catalog = TAGS
+    detail = True
+
+
+class IngredientList(CatalogView):
+    viewset = IngredientViewSet
+    basename = 'ingredients'
+    catalog = INGREDIENTS
+
+
+class IngredientDetail(CatalogView):
+    viewset = IngredientViewSet
+    basename = 'ingredients'
+    catalog = INGREDIENTS
+    detail = True
+
+
+def as_view(view_class):
+    view = view_class()
+
+    async def async_view(request, **kwargs):
+        return await view(request, **kwargs)
+
+    # DRF-вьюсеты сами отвечают за CSRF.
+    async_view.csrf_exempt = True
+    # Как у вьюсетов: по ним профилирование называет эндпоинт.
+    async_view.cls = view_class.viewset
+    async_view.actions = view.actions
+    return async_view
@@ -0,0 +1,73 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import (
+    TokenAuthentication, get_authorization_header
+)
+
+token_cache = caches['auth']
+# Метка отозванного токена вместо записи в кэше. Живёт дольше любого
+# запроса, который мог прочитать токен из БД до отзыва.
+REVOKED = 'revoked'
+REVOKED_TIMEOUT = 60
+
+
+def token_cache_key(key):
+    # Сам токен в ключ не попадает: ключи кэша видны в Redis.
+    return f'token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def forget_tokens(*keys):
+    """После коммита заменяет токены в кэше меткой REVOKED.
+
+    Параллельный запрос, который прочитал токен из БД ещё до отзыва,
+    кладёт его в кэш через add и метку не перезапишет."""
+    cache_keys = [token_cache_key(key) for key in keys]
+    if cache_keys and not settings.LOCMEM_CACHE:
+        transaction.on_commit(lambda: token_cache.set_many(
+            dict.fromkeys(cache_keys, REVOKED), timeout=REVOKED_TIMEOUT,
+        ))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который хранит токен вместе с пользователем
+    в кэше 'auth' и не ходит в БД на каждый запрос.
+
+    Запись живёт не дольше AUTH_TOKEN_CACHE_TIMEOUT и заменяется меткой
+    REVOKED при удалении токена (token/logout/) и при изменении
+    пользователя; пока метка жива, токен проверяется по БД. С
+    кэшем в памяти процесса (LOCMEM_CACHE) удаление дошло бы только до
+    одного воркера, и в остальных токен жил бы после выхода, поэтому
+    тогда это обычный TokenAuthentication."""
+
+    def authenticate_credentials(self, key):
+        if settings.LOCMEM_CACHE:
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        cached = token_cache.get(cache_key)
+        if cached is not None and cached != REVOKED:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        if cached is None:
+            token_cache.add(cache_key, (user, token))
+        return user, token
+
+    async def aauthenticate(self, request):
+        """Для асинхронных вьюх: при попадании в кэш обходится без
+        потока для синхронного кода."""
+        auth = get_authorization_header(request).split()
+        keyword = self.keyword.lower().encode()
+        if (not settings.LOCMEM_CACHE and len(auth) == 2
+                and auth[0].lower() == keyword):
+            try:
+                cached = await token_cache.aget(
+                    token_cache_key(auth[1].decode())
+                )
+            except UnicodeError:
+                cached = None
+            if cached is not None and cached != REVOKED:
+                return cached
+        return await sync_to_async(self.authenticate)(request)
@@ -0,0 +1,85 @@
+import hashlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from recipes.versions import (
+    INGREDIENTS, TAGS, as_datetime, current_versions, get_version,
+    get_versions, recipe_version, user_version
+)
+
+
+class VersionMemoMiddleware:
+    """Метки версий читаются из кэша или DataVersion не больше раза
+    за запрос."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = current_versions.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            current_versions.reset(token)
+
+    async def __acall__(self, request):
+        token = current_versions.set({})
+        try:
+            return await self.get_response(request)
+        finally:
+            current_versions.reset(token)
+
+
+def catalog_etag(name):
+    def etag(request, *args, **kwargs):
+        return f'{name}-{get_version(name)}'
+    return etag
+
+
+def catalog_last_modified(name):
+    def last_modified(request, *args, **kwargs):
+        return as_datetime(get_version(name))
+    return last_modified
+
+
+def catalog_condition(name):
+    """ETag/Last-Modified по версии справочника: при совпадении ответ
+    304 отдаётся без сериализации. Метка берётся из общего кэша, так что
+    в БД такой ответ не ходит; с кэшем в памяти процесса (LOCMEM_CACHE)
+    и при промахе метка читается из DataVersion одним запросом."""
+    return method_decorator(condition(
+        etag_func=catalog_etag(name),
+        last_modified_func=catalog_last_modified(name),
+    ))
+
+
+def recipe_versions(request, pk):
+    names = [recipe_version(pk), TAGS, INGREDIENTS]
+    if request.user.is_authenticated:
+        names.append(user_version(request.user.pk))
+    return get_versions(*names)
+
+
+def recipe_etag(request, *args, pk=None, **kwargs):
+    versions = '-'.join(str(version)
+                        for version in recipe_versions(request, pk))
+    digest = hashlib.md5(f'{request.user.pk}-{versions}'.encode())
+    return f'recipe-{pk}-{digest.hexdigest()}'
+
+
+def recipe_last_modified(request, *args, pk=None, **kwargs):
+    return as_datetime(max(recipe_versions(request, pk)))
+
+
+recipe_condition = method_decorator(condition(
+    etag_func=recipe_etag, last_modified_func=recipe_last_modified,
+))
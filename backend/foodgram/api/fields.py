@@ -0,0 +1,66 @@
+import base64
+import binascii
+import uuid
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+
+class Base64ImageField(serializers.ImageField):
+    """Картинка в base64 (data URI).
+
+    Декодируется частями сразу во временный файл на диске, чтобы не
+    держать в памяти воркера ещё одну копию картинки. Строка-ссылка
+    (картинка не менялась) пропускается."""
+    chunk_size = 64 * 1024
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            raise SkipField()
+        if isinstance(data, str) and data.startswith('data:'):
+            data = self.decode(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        start = data.find(';base64,')
+        if start == -1:
+            self.fail('invalid')
+        content_type = data[len('data:'):start]
+        start += len(';base64,')
+        temp_file = TemporaryUploadedFile(
+            name=f'{uuid.uuid4()}.{content_type.split("/")[-1]}',
+            content_type=content_type,
+            size=0,
+            charset=None,
+        )
+        # Переносы строк и пробелы сдвигают четвёрки символов base64 между
+        # частями, поэтому их убираем, а хвост не кратный 4 переносим.
+        tail = ''
+        try:
+            for position in range(start, len(data), self.chunk_size):
+                chunk = tail + ''.join(
+                    data[position:position + self.chunk_size].split()
+                )
+                cut = len(chunk) - len(chunk) % 4
+                temp_file.write(base64.b64decode(chunk[:cut]))
+                tail = chunk[cut:]
+            if tail:
+                temp_file.write(base64.b64decode(tail))
+        except binascii.Error:
+            temp_file.close()
+            self.fail('invalid')
+        temp_file.size = temp_file.tell()
+        temp_file.seek(0)
+        return temp_file
+
+
+class ThumbnailImageField(serializers.ImageField):
+    """Ссылка на миниатюру рецепта, пока её нет - на исходную картинку."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return instance.thumbnail or instance.image
@@ -1,48 +1,91 @@
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from recipes.search import ingredient_index, search_recipes
+from recipes.versions import TAGS, get_version
 
 
-class IngredientSearchFilter(SearchFilter):
-    """Поиск ингредиентов по имени."""
+# Метка TAGS пишется после коммита; если запись не дошла, устаревший
+# список слагов проживёт в кэше не дольше этого времени.
+TAG_CHOICES_TIMEOUT = 300
+
+
+def tag_choices():
+    """Слаги тегов из кэша по версии справочника тегов, без запроса
+    SELECT DISTINCT по всем рецептам."""
+    return cache.get_or_set(
+        f'tag_choices:{get_version(TAGS)}',
+        lambda: [(slug, slug) for slug in Tag.objects.values_list(
+            'slug', flat=True
+        ).order_by('slug')],
+        timeout=TAG_CHOICES_TIMEOUT,
+    )
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов по имени через индекс в памяти.
+
+    К БД обращается только сверка версии каталога, и то не чаще раза
+    в IngredientIndex.check_interval секунд."""
 
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        if view.action != 'list':
+            return queryset
+        return ingredient_index.search(
+            request.query_params.get(self.search_param, '')
+        )
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск рецептов по названию, тексту и ингредиентам."""
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_recipes(queryset, query)
+
 
 class RecipeFilter(FilterSet):
     is_favorited = filters.BooleanFilter(method='get_is_favorited',)
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method='get_tags',
     )
 
     class Meta:
         model = Recipe
         fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
 
-    def get_is_favorited(self, queryset, is_favorited, slug):
+    def user_choice(self, queryset, model, value):
+        """Полусоединение EXISTS вместо JOIN и DISTINCT: строки рецептов
+        не размножаются, и сортировка идёт по исходной выборке."""
         user = self.request.user
         if not user.is_authenticated:
             return queryset
-        is_favorited = self.request.query_params.get('is_favorited',)
-        if is_favorited:
-            return queryset.filter(
-                favorites__user=self.request.user
-            ).distinct()
-        return queryset
-
-    def get_is_in_shopping_cart(self, queryset, is_in_shopping_cart, slug):
-        user = self.request.user
-        if not user.is_authenticated:
+        chosen = Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(chosen if value else ~chosen)
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.user_choice(queryset, Favorite, value)
+
+    def get_is_in_shopping_cart(self, queryset, name, value):
+        return self.user_choice(queryset, ShoppingCart, value)
+
+    def get_tags(self, queryset, name, value):
+        if not value:
             return queryset
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart',
-        )
-        if is_in_shopping_cart:
-            return queryset.filter(
-                in_shopping_list__user=self.request.user
-            ).distinct()
-        return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value,
+        )))
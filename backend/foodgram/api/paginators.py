@@ -1,7 +1,95 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+
+CURSOR_MODE = 'cursor'
+
+
+def count_cache_key(queryset):
+    query = str(queryset.query).encode()
+    return f'pagination:count:{hashlib.md5(query).hexdigest()}'
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, кэширующий COUNT(*) выборки на короткое время."""
+
+    @cached_property
+    def count(self):
+        timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        if not timeout or not hasattr(self.object_list, 'query'):
+            return super().count
+        return cache.get_or_set(
+            count_cache_key(self.object_list),
+            lambda: super(CachedCountPaginator, self).count, timeout,
+        )
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """Курсорная пагинация без OFFSET и COUNT(*).
+
+    Порядок берётся из атрибута cursor_ordering вьюсета."""
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 20
+    ordering = ('-pk',)
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
 
 
 class CustomPagination(pagination.PageNumberPagination):
+    """Постраничная пагинация; ?pagination=cursor включает курсорную."""
     page_size = 6
     page_size_query_param = "limit"
     max_page_size = 20
+    mode_query_param = 'pagination'
+    django_paginator_class = CachedCountPaginator
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Курсор строится по полям выборки из БД, списки - только
+        # постранично.
+        if (request.query_params.get(self.mode_query_param) == CURSOR_MODE
+                and hasattr(queryset, 'query')):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Асинхронный вариант постраничной пагинации для ASGI-вьюх."""
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request)
+        )
+        paginator.count = await self.acount(queryset)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)
+            ))
+        self.request = request
+        self.keyset = None
+        return [obj async for obj in self.page.object_list]
+
+    async def acount(self, queryset):
+        timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        if not timeout:
+            return await queryset.acount()
+        key = count_cache_key(queryset)
+        count = await cache.aget(key)
+        if count is None:
+            count = await queryset.acount()
+            await cache.aset(key, count, timeout)
+        return count
@@ -0,0 +1,223 @@
+"""Выборочное профилирование запросов.
+
+Для доли запросов PROFILING_SAMPLE_RATE считаются SQL-запросы и время
+в БД, время сериализации (и запросы, сделанные из сериализаторов - это
+и есть N+1) и полное время ответа. Итоги уходят в заголовок
+Server-Timing и накапливаются в кэше profiling по действиям вьюсетов
+(RecipeViewSet.list и т.п.)."""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+profile_cache = caches['profiling']
+
+current_profile = ContextVar('current_profile', default=None)
+
+ENDPOINTS_KEY = 'endpoints'
+COUNTERS = (
+    'requests', 'queries', 'db_us', 'serialize_queries', 'serialize_us',
+    'total_us',
+)
+MAXIMUMS = ('max_queries', 'max_total_us')
+
+
+class RequestProfile:
+    __slots__ = ('started', 'queries', 'db', 'serialize_queries',
+                 'serialize', 'serializing')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = self.serialize_queries = 0
+        self.db = self.serialize = 0.0
+        self.serializing = False
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize * 1000:.1f};'
+            f'desc="{self.serialize_queries} queries"',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def count_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.db += time.perf_counter() - started
+        if profile.serializing:
+            profile.serialize_queries += 1
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Сигнал приходит при каждом переподключении, обёртка ставится раз.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class ProfiledSerializerMixin:
+    """Засекает сериализацию: вложенные сериализаторы и элементы
+    списка считаются в общее время внешнего."""
+
+    def to_representation(self, instance):
+        profile = current_profile.get()
+        if profile is None or profile.serializing:
+            return super().to_representation(instance)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            profile.serialize += time.perf_counter() - started
+            profile.serializing = False
+
+
+def endpoint_name(view_func, request):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+def metric_key(endpoint, metric):
+    return f'{endpoint}:{metric}'
+
+
+def record(endpoint, profile, total):
+    """Добавляет замер к итогам эндпоинта. Счётчики увеличиваются
+    атомарно (incr), максимумы - приблизительно."""
+    values = {
+        'requests': 1,
+        'queries': profile.queries,
+        'db_us': round(profile.db * 1_000_000),
+        'serialize_queries': profile.serialize_queries,
+        'serialize_us': round(profile.serialize * 1_000_000),
+        'total_us': round(total * 1_000_000),
+    }
+    for metric, value in values.items():
+        key = metric_key(endpoint, metric)
+        if not profile_cache.add(key, value, timeout=None):
+            profile_cache.incr(key, value)
+    for metric, value in (('max_queries', values['queries']),
+                          ('max_total_us', values['total_us'])):
+        key = metric_key(endpoint, metric)
+        if value > profile_cache.get(key, -1):
+            profile_cache.set(key, value, timeout=None)
+    endpoints = profile_cache.get(ENDPOINTS_KEY, set())
+    if endpoint not in endpoints:
+        profile_cache.set(ENDPOINTS_KEY, endpoints | {endpoint},
+                          timeout=None)
+
+
+def report(order='total_ms', limit=20):
+    """Итоги по эндпоинтам, худшие по order сверху."""
+    endpoints = profile_cache.get(ENDPOINTS_KEY, set())
+    stored = profile_cache.get_many([
+        metric_key(endpoint, metric)
+        for endpoint in endpoints for metric in COUNTERS + MAXIMUMS
+    ])
+    rows = []
+    for endpoint in endpoints:
+        values = {
+            metric: stored.get(metric_key(endpoint, metric), 0)
+            for metric in COUNTERS + MAXIMUMS
+        }
+        requests = values['requests']
+        if not requests:
+            continue
+        rows.append({
+            'endpoint': endpoint,
+            'requests': requests,
+            'queries': round(values['queries'] / requests, 1),
+            'max_queries': values['max_queries'],
+            'serialize_queries': round(
+                values['serialize_queries'] / requests, 1
+            ),
+            'db_ms': round(values['db_us'] / requests / 1000, 1),
+            'serialize_ms': round(
+                values['serialize_us'] / requests / 1000, 1
+            ),
+            'total_ms': round(values['total_us'] / requests / 1000, 1),
+            'max_total_ms': round(values['max_total_us'] / 1000, 1),
+        })
+    rows.sort(key=lambda row: row[order], reverse=True)
+    return rows[:limit]
+
+
+def reset_report():
+    endpoints = profile_cache.get(ENDPOINTS_KEY, set())
+    profile_cache.delete_many([ENDPOINTS_KEY, *(
+        metric_key(endpoint, metric)
+        for endpoint in endpoints for metric in COUNTERS + MAXIMUMS
+    )])
+
+
+class ProfilingMiddleware:
+    """Профилирует случайную долю запросов (PROFILING_SAMPLE_RATE).
+
+    Стоит первой в MIDDLEWARE, чтобы total включал всю обработку.
+    При доле 0 отключается целиком."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_counter)
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.finish(request, response, profile)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if current_profile.get() is not None:
+            request.profile_endpoint = endpoint_name(view_func, request)
+
+    def finish(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        response['Server-Timing'] = profile.server_timing(total)
+        endpoint = getattr(request, 'profile_endpoint', None)
+        if endpoint is not None:
+            record(endpoint, profile, total)
+        return response
@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework import renderers
+
+PDF_FONT_NAME = 'ShoppingListFont'
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(ABC, renderers.BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Сам список отдаётся потоком через stream(), render() используется
+    только для ответов с ошибками."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode()
+
+    @abstractmethod
+    def stream(self, items):
+        """Части файла по строкам списка покупок."""
+
+
+class TxtShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        separator = ''
+        for item in items:
+            yield (f"{separator}{item['name']}: "
+                   f"{item['total_amount']} {item['unit']} ")
+            separator = '\r\n'
+
+
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единицы измерения')
+        )
+        for item in items:
+            yield writer.writerow(
+                (item['name'], item['total_amount'], item['unit'])
+            )
+
+
+class JsonShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    # JSON всегда в UTF-8, параметр charset у application/json не нужен.
+    charset = None
+
+    def stream(self, items):
+        separator = '['
+        for item in items:
+            yield separator + json.dumps({
+                'name': item['name'],
+                'amount': item['total_amount'],
+                'measurement_unit': item['unit'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    """PDF собирается целиком: таблица ссылок на объекты пишется в конце
+    файла, поэтому отдать его по частям нельзя."""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def get_font(self):
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        return PDF_FONT_NAME
+
+    def stream(self, items):
+        buffer = io.BytesIO()
+        font = self.get_font()
+        page = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        page.setFont(font, self.font_size)
+        for item in items:
+            if y < self.margin:
+                page.showPage()
+                page.setFont(font, self.font_size)
+                y = height - self.margin
+            page.drawString(
+                self.margin, y,
+                f"{item['name']}: {item['total_amount']} {item['unit']}",
+            )
+            y -= self.line_height
+        page.save()
+        yield buffer.getvalue()
+
+
+SHOPPING_LIST_RENDERERS = (
+    TxtShoppingListRenderer,
+    CsvShoppingListRenderer,
+    JsonShoppingListRenderer,
+    PdfShoppingListRenderer,
+)
@@ -1,20 +1,33 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.core.validators import MinValueValidator
 from django.db import transaction
-from drf_base64.fields import Base64ImageField
+from django.db.models import F, prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
 from recipes.models import (
     Favorite, Ingredient, IngredientInRecipe,
-    Recipe, ShoppingCart, Tag
+    Recipe, ShoppingCart, ShoppingListItem, Tag,
+    recipe_amounts, recipe_prefetches
 )
+from recipes.nutrition import nutrition_matrix
+from recipes.pantry import recipe_ingredients_changed
+from recipes.search import update_search_index
+from recipes.thumbnails import schedule_thumbnail
+from recipes.versions import recipe_payload_key
 from users.serializers import CustomUserSerializer
 
+from .fields import Base64ImageField, ThumbnailImageField
+from .profiling import ProfiledSerializerMixin
+
 User = get_user_model()
 
+recipe_cache = caches['recipes']
+
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ProfiledSerializerMixin,
+                    serializers.ModelSerializer):
     """Сериализатор для модели тег."""
     color = serializers.CharField(source='hexcolor')
     slug = serializers.SlugField(
@@ -30,7 +43,8 @@ class TagSerializer(serializers.ModelSerializer):
         model = Tag
 
 
-class IngredientShowSerializer(serializers.ModelSerializer):
+class IngredientShowSerializer(ProfiledSerializerMixin,
+                               serializers.ModelSerializer):
     """Вывод ингредиентов по GET-запросу."""
     class Meta:
         fields = ('id', 'name', 'measurement_unit')
@@ -60,15 +74,48 @@ class IngredientAddToRecipeSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
+class PantrySerializer(serializers.Serializer):
+    """Имеющиеся ингредиенты и ингредиенты, которых быть не должно."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=200,
+    )
+    exclude = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        default=list,
+        max_length=200,
+    )
+
+
+class RecipeShortSerializer(ProfiledSerializerMixin,
+                            serializers.ModelSerializer):
     """Вывод короткого отображение рецепта."""
-    image = Base64ImageField(required=False, allow_null=True)
+    image = ThumbnailImageField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time',)
 
 
+class SimilarRecipeSerializer(RecipeShortSerializer):
+    """Похожий рецепт с близостью от 0 до 1."""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + ('similarity',)
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Создаёт и редактирует рецепты."""
     ingredients = IngredientAddToRecipeSerializer(many=True)
@@ -91,6 +138,14 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ('author',)
         model = Recipe
 
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться.'
+            )
+        return ingredients
+
     def create_ingredients(self, ingredients, recipe):
         create_ingredient = [
             IngredientInRecipe(
@@ -101,6 +156,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         ]
         IngredientInRecipe.objects.bulk_create(create_ingredient)
+        # bulk_create не отправляет сигналы.
+        recipe_ingredients_changed([recipe.id])
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Временный файл картинки уже перенесён в хранилище.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
 
     @transaction.atomic
     def create(self, validated_data):
@@ -108,9 +174,16 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         author = validated_data.pop('author')
         recipe = Recipe.objects.create(author=author, **validated_data)
+        User.objects.filter(pk=author.pk).update(
+            recipes_count=F('recipes_count') + 1
+        )
         # self.create_tags(tags, recipe)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        # Сигнал post_save сработал до добавления ингредиентов.
+        update_search_index([recipe.id])
+        if recipe.image:
+            schedule_thumbnail(recipe.id)
 
         return recipe
 
@@ -118,26 +191,50 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', None)
         # instance.tags.clear()
+        old_amounts = recipe_amounts(instance)
         IngredientInRecipe.objects.filter(recipe=instance).all().delete()
         instance.tags.set(tags)
         # self.create_tags(validated_data.pop('tags'), instance)
         self.create_ingredients(validated_data.pop('ingredients'), instance)
+        self.update_shopping_lists(instance, old_amounts)
+        if 'image' in validated_data:
+            validated_data['thumbnail'] = None
+            schedule_thumbnail(instance.id)
         return super().update(instance, validated_data)
 
+    def update_shopping_lists(self, instance, old_amounts):
+        """Переносит изменения ингредиентов в списки покупок."""
+        user_ids = ShoppingCart.objects.filter(
+            recipe=instance
+        ).values_list('user_id', flat=True)
+        new_amounts = recipe_amounts(instance)
+        ShoppingListItem.objects.apply_deltas(user_ids, {
+            ingredient: (
+                new_amounts.get(ingredient, 0)
+                - old_amounts.get(ingredient, 0)
+            )
+            for ingredient in old_amounts.keys() | new_amounts.keys()
+        })
+
     def to_representation(self, instance):
         return RecipeShowSerializer(
             instance, context={'request': self.context.get('request')}
         ).data
 
 
-class RecipeShowSerializer(serializers.ModelSerializer):
-    """Вывод рецепта и списка рецептов."""
+class RecipeShowSerializer(ProfiledSerializerMixin,
+                           serializers.ModelSerializer):
+    """Вывод рецепта и списка рецептов.
+
+    Общая для всех пользователей часть рецепта кэшируется по версии,
+    флаги текущего пользователя подставляются поверх."""
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
-    image = Base64ImageField(required=False, allow_null=True)
+    image = serializers.ImageField(read_only=True)
+    nutrition = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         fields = ('id',
@@ -150,16 +247,55 @@ class RecipeShowSerializer(serializers.ModelSerializer):
                   'image',
                   'text',
                   'cooking_time',
+                  'nutrition',
                   )
         model = Recipe
 
+    cache_payload = True
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        if not self.cache_payload:
+            return super().to_representation(instance)
+
+        key = recipe_payload_key(instance)
+        data = recipe_cache.get(key)
+        if data is None:
+            prefetch_related_objects([instance], *recipe_prefetches())
+            data = super().to_representation(instance)
+            # Картинка кэшируется ссылкой без хоста: абсолютная строится
+            # по текущему запросу, иначе Host одного запроса (а
+            # ALLOWED_HOSTS не ограничен) попал бы в ответы всем.
+            recipe_cache.set(key, {
+                **data,
+                'image': instance.image.url if instance.image else None,
+                'author': {**data['author'], 'is_subscribed': False},
+                'is_favorited': False,
+                'is_in_shopping_cart': False,
+            })
+            return data
+        request = self.context.get('request')
+        if data['image'] and request is not None:
+            data['image'] = request.build_absolute_uri(data['image'])
+        data['author']['is_subscribed'] = self.fields[
+            'author'
+        ].get_is_subscribed(instance.author)
+        data['is_favorited'] = self.get_is_favorited(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        return data
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -167,5 +303,29 @@ class RecipeShowSerializer(serializers.ModelSerializer):
             user=request.user, recipe=obj).exists()
 
     def get_ingredients(self, obj):
-        ingredient = IngredientInRecipe.objects.filter(recipe=obj)
-        return IngredientInRecipeSerializer(ingredient, many=True).data
+        return IngredientInRecipeSerializer(
+            obj.recipe_with.all(), many=True
+        ).data
+
+    def get_nutrition(self, obj):
+        """Калорийность, БЖУ и стоимость; кэшируется вместе с рецептом."""
+        recipes, _ = nutrition_matrix.recipe_totals([obj.pk], [
+            (obj.pk, item.ingredient_id, item.amount)
+            for item in obj.recipe_with.all()
+        ])
+        return recipes[obj.pk]
+
+
+class RecipeListSerializer(RecipeShowSerializer):
+    """Вывод списка рецептов с миниатюрами вместо картинок."""
+    image = ThumbnailImageField()
+    nutrition = None
+
+    class Meta(RecipeShowSerializer.Meta):
+        fields = tuple(
+            field for field in RecipeShowSerializer.Meta.fields
+            if field != 'nutrition'
+        )
+
+    # Страница списка и так собирается фиксированным числом запросов.
+    cache_payload = False
@@ -1,43 +1,89 @@
+from itertools import chain
+
 from django.contrib.auth import get_user_model
-from django.db.models import F, Sum
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .filterset import IngredientSearchFilter, RecipeFilter
+from .conditional import catalog_condition, recipe_condition
+from .filterset import (
+    IngredientSearchFilter, RecipeFilter, RecipeSearchFilter
+)
 from .paginators import CustomPagination
-from .permissions import IsAdminOrReadOnly, IsAdminOrAuthorOrReadOnly
+from .permissions import IsAdmin, IsAdminOrReadOnly, IsAdminOrAuthorOrReadOnly
+from .profiling import report, reset_report
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (
-    IngredientShowSerializer,
-    RecipeCreateSerializer, RecipeShortSerializer, RecipeShowSerializer,
+    IngredientShowSerializer, PantrySerializer,
+    RecipeCreateSerializer, RecipeIdsSerializer, RecipeListSerializer,
+    RecipeShortSerializer,
+    RecipeShowSerializer, SimilarRecipeSerializer,
     TagSerializer
 )
 from recipes.models import (
-    Favorite, Ingredient, IngredientInRecipe,
-    Recipe, ShoppingCart, Tag
+    Favorite, Ingredient,
+    Recipe, ShoppingCart, ShoppingListItem, Tag
+)
+from recipes.nutrition import nutrition_matrix
+from recipes.pantry import pantry_index
+from recipes.versions import (
+    INGREDIENTS, TAGS, bump_version, user_version
 )
 
 User = get_user_model()
 
+SHOPPING_LIST_CHUNK_SIZE = 500
+
+TOGGLE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'carts_count',
+}
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
-    queryset = Recipe.objects.select_related('author',)
-    filter_backends = (DjangoFilterBackend,)
+    queryset = Recipe.objects.all()
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     filterset_class = RecipeFilter
     pagination_class = CustomPagination
+    cursor_ordering = ('-pub_date', '-id')
+    lookup_value_regex = r'\d+'
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.with_related()
+        if self.action not in ('retrieve', 'list'):
+            return queryset
+        # Теги и ингредиенты рецепта обычно берутся из кэша.
+        return queryset.select_related('author').with_user_flags(
+            self.request.user
+        )
+
     def get_serializer_class(self):
-        if self.action in (['retrieve', 'list']):
+        if self.action == 'list':
+            return RecipeListSerializer
+        if self.action == 'retrieve':
             return RecipeShowSerializer
         return RecipeCreateSerializer
 
+    @recipe_condition
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
     def partial_update(self, request, *args, **kwargs):
         kwargs['partial'] = False
         return self.update(request, *args, **kwargs)
@@ -45,40 +91,96 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.add_recipe(
+            instance.in_shopping_list.values_list('user_id', flat=True),
+            instance,
+            sign=-1,
+        )
+        # Счётчик мог разойтись с данными (до rebuild_counters), а ниже
+        # нуля его не пустит CHECK у PositiveIntegerField.
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=Greatest(F('recipes_count') - 1, 0)
+        )
+        instance.delete()
+
+    def on_toggle(self, model, user, recipe_ids, sign):
+        """Обновляет счётчики рецептов и сводный список покупок."""
+        counter = TOGGLE_COUNTERS[model]
+        Recipe.objects.filter(pk__in=recipe_ids).update(**{
+            counter: Greatest(F(counter) + sign, 0)
+        })
+        if model is ShoppingCart:
+            ShoppingListItem.objects.add_recipes([user.id], recipe_ids, sign)
+        # add() и remove() не отправляют сигналы модели.
+        bump_version(user_version(user.id))
+
+    def toggle(self, model, user, recipe_ids, sign):
+        """Добавляет или удаляет связи одним запросом и возвращает id
+        рецептов, для которых что-то изменилось."""
+        with transaction.atomic():
+            if sign > 0:
+                changed = model.objects.add(user, recipe_ids)
+            else:
+                changed = model.objects.remove(user, recipe_ids)
+            if changed:
+                self.on_toggle(model, user, changed, sign)
+        return changed
+
     def post_delete_fav_shop_cart(self, request, pk, model):
         user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-
-        if self.request.method == 'POST':
-            model_create = model.objects.filter(user=user, recipe=recipe)
-            if not model_create.exists():
-                model.objects.create(
-                    user=request.user,
-                    recipe=recipe
+        sign = 1 if request.method == 'POST' else -1
+        if self.toggle(model, user, [int(pk)], sign):
+            if sign > 0:
+                serializer = RecipeShortSerializer(
+                    instance=Recipe.objects.get(pk=pk)
                 )
-                serializer = RecipeShortSerializer(instance=recipe)
                 return Response(
                     serializer.data,
                     status=status.HTTP_201_CREATED,
                 )
+            return Response(
+                {'errors': 'Вы больше не следите за этим рецептом'},
+                status=status.HTTP_201_CREATED,
+            )
+
+        # Ничего не изменилось: рецепта нет или он уже выбран/удалён.
+        get_object_or_404(Recipe, pk=pk)
+        if sign > 0:
             return Response(
                 {'errors': 'Этот рецепт уже был выбран'},
                 status=status.HTTP_204_NO_CONTENT,
             )
+        return Response(
+            {'errors': 'Этот рецепт уже удалён'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        if self.request.method == 'DELETE':
-            model_delete = model.objects.filter(user=user, recipe=recipe)
-            if model_delete.exists():
-                model_delete.delete()
-                return Response(
-                    {'errors': 'Вы больше не следите за этим рецептом'},
-                    status=status.HTTP_201_CREATED,
-                )
-            else:
-                return Response(
-                    {'errors': 'Этот рецепт уже удалён'},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+    def bulk_fav_shop_cart(self, request, model):
+        """Добавляет или удаляет сразу несколько рецептов: {"recipes": [id]}.
+
+        Уже выбранные и несуществующие рецепты пропускаются."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sign = 1 if request.method == 'POST' else -1
+        changed = self.toggle(
+            model, request.user,
+            sorted(set(serializer.validated_data['recipes'])), sign,
+        )
+        if sign < 0:
+            if changed:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(
+                {'errors': 'Этих рецептов нет в списке'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            RecipeShortSerializer(
+                Recipe.objects.filter(pk__in=changed), many=True
+            ).data,
+            status=status.HTTP_201_CREATED,
+        )
 
     @action(detail=True, methods=('post', 'delete'), url_path='favorite',
             permission_classes=[IsAuthenticated],)
@@ -94,32 +196,119 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request, pk, ShoppingCart,
         )
 
+    @action(detail=False, methods=('post', 'delete'), url_path='favorite',
+            permission_classes=[IsAuthenticated],)
+    def favorite_bulk(self, request):
+        return self.bulk_fav_shop_cart(request, Favorite)
+
+    @action(detail=False, methods=('get', 'post', 'delete'),
+            url_path='shopping_cart', permission_classes=[IsAuthenticated],)
+    def shopping_cart_bulk(self, request):
+        if request.method == 'GET':
+            return self.shopping_cart_nutrition(request)
+        return self.bulk_fav_shop_cart(request, ShoppingCart)
+
+    def shopping_cart_nutrition(self, request):
+        """Рецепты в корзине с калорийностью, БЖУ и стоимостью и итог
+        по всей корзине, посчитанные одним проходом."""
+        recipes = Recipe.objects.filter(
+            in_shopping_list__user=request.user,
+        ).only('name', 'image', 'thumbnail', 'cooking_time').order_by('name')
+        data = RecipeShortSerializer(recipes, many=True).data
+        per_recipe, total = nutrition_matrix.recipe_totals(
+            [item['id'] for item in data]
+        )
+        for item in data:
+            item['nutrition'] = per_recipe[item['id']]
+        return Response({'nutrition': total, 'recipes': data})
+
+    @action(detail=False, methods=('post',),
+            permission_classes=[IsAuthenticated],)
+    def pantry(self, request):
+        """Что приготовить из имеющихся ингредиентов:
+        {"ingredients": [id], "exclude": [id]}.
+
+        Рецепты идут по доле ингредиентов, которые уже есть."""
+        serializer = PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        matches = self.paginate_queryset(pantry_index.match(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['exclude'],
+        ))
+        recipes = Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).in_bulk([match.recipe_id for match in matches])
+        # Рецепт мог быть удалён после последней сверки индекса.
+        matches = [match for match in matches if match.recipe_id in recipes]
+        data = RecipeListSerializer(
+            [recipes[match.recipe_id] for match in matches],
+            many=True, context=self.get_serializer_context(),
+        ).data
+        for item, match in zip(data, matches):
+            item['matched_ingredients'] = match.matched
+            item['missing_ingredients'] = match.total - match.matched
+        return self.get_paginated_response(data)
+
+    @action(detail=True, methods=('get',))
+    def similar(self, request, pk):
+        """Похожие рецепты по ингредиентам и тегам, самые близкие первыми.
+
+        Соседи заранее рассчитаны командой compute_similar_recipes."""
+        recipes = Recipe.objects.filter(
+            similar_to__recipe_id=pk,
+        ).annotate(
+            similarity=F('similar_to__score'),
+        ).order_by('-similarity').only(
+            'name', 'image', 'thumbnail', 'cooking_time',
+        )
+        data = SimilarRecipeSerializer(recipes, many=True).data
+        if not data:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(data)
+
     @action(detail=False, methods=('get',),
             permission_classes=[IsAuthenticated],)
+    def feed(self, request):
+        """Лента подписок: новые рецепты авторов, на которых подписан
+        пользователь, свежие первыми."""
+        queryset = Recipe.objects.feed(request.user).with_related(
+        ).with_user_flags(request.user)
+        serializer = RecipeListSerializer(
+            self.paginate_queryset(queryset), many=True,
+            context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('get',),
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS,)
     def download_shopping_cart(self, request):
+        """Список покупок потоком: ?format=txt|csv|json|pdf."""
         user = request.user
 
-        if not ShoppingCart.objects.filter(user=user).exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__in_shopping_list__user=user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
+        ingredients = ShoppingListItem.objects.filter(
+            user=user
         ).annotate(
             name=F('ingredient__name'),
             unit=F('ingredient__measurement_unit'),
-            total_amount=Sum('amount')
+        ).values(
+            'name', 'unit', 'total_amount'
         ).order_by(
             '-total_amount'
-        )
+        ).iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        first = next(ingredients, None)
+        if first is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        shopping_list = '\r\n'.join(
-            [(f"{item['name']}: {item['total_amount']} {item['unit']} ")
-             for item in ingredients]
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(chain((first,), ingredients)),
+            content_type=(
+                f'{renderer.media_type}; charset={renderer.charset}'
+                if renderer.charset else renderer.media_type
+            ),
         )
-        filename = f'{request.user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        filename = f'{user.username}_shopping_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
@@ -129,12 +318,51 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientShowSerializer
     filter_backends = [IngredientSearchFilter, ]
-    search_fields = ['^name', ]
     permission_classes = (IsAdminOrReadOnly,)
 
+    @catalog_condition(INGREDIENTS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_condition(INGREDIENTS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тегов"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
+
+    @catalog_condition(TAGS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog_condition(TAGS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class ProfilingReportView(APIView):
+    """Худшие эндпоинты по данным профилирования, ?order= и ?limit=.
+    DELETE сбрасывает накопленные итоги."""
+    permission_classes = (IsAdmin,)
+    orderings = (
+        'total_ms', 'max_total_ms', 'queries', 'max_queries',
+        'serialize_queries', 'db_ms', 'serialize_ms', 'requests',
+    )
+
+    def get(self, request):
+        order = request.query_params.get('order', 'total_ms')
+        if order not in self.orderings:
+            return Response({'order': [
+                f'Допустимые значения: {", ".join(self.orderings)}'
+            ]}, status=status.HTTP_400_BAD_REQUEST)
+        limit = request.query_params.get('limit', '20')
+        limit = int(limit) if limit.isdigit() else 20
+        return Response(report(order, limit))
+
+    def delete(self, request):
+        reset_report()
+        return Response(status=status.HTTP_204_NO_CONTENT)
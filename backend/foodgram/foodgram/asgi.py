@@ -0,0 +1,19 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', 'true')
+# Под ASGI соединения с БД не переиспользуются между запросами, их
+# держит пулер.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+application = get_asgi_application()
+
+from recipes.nutrition import nutrition_matrix  # noqa: E402
+from recipes.pantry import pantry_index  # noqa: E402
+from recipes.search import ingredient_index  # noqa: E402
+
+ingredient_index.warm()
+nutrition_matrix.warm()
+pantry_index.warm()
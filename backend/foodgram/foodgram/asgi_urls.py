@@ -0,0 +1,10 @@
+"""URL-ы для ASGI: GET-чтение рецептов, тегов и ингредиентов идёт через
+асинхронные вьюхи, остальное - как в foodgram.urls."""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+    *sync_urlpatterns,
+]
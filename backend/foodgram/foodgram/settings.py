@@ -38,6 +38,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware',
+    'api.conditional.VersionMemoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,7 +49,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+# Под ASGI GET-запросы к рецептам, тегам и ингредиентам обслуживают
+# асинхронные вьюхи (api.async_views), остальное - обычные вьюсеты.
+ASYNC_READ_VIEWS = (
+    os.getenv('ASYNC_READ_VIEWS', default='false').lower()
+    in ('true', '1', 'yes')
+)
+
+ROOT_URLCONF = 'foodgram.asgi_urls' if ASYNC_READ_VIEWS else 'foodgram.urls'
 
 TEMPLATES = [
     {
@@ -66,10 +75,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', default='60')
+# Внешний пулер соединений перед PostgreSQL: '' или 'pgbouncer'.
+DB_POOLER = os.getenv('DB_POOLER', default='')
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
@@ -77,10 +91,75 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Соединение живёт DB_CONN_MAX_AGE секунд (0 - закрывается после
+        # каждого запроса, none - без ограничения) и перед повторным
+        # использованием проверяется.
+        'CONN_MAX_AGE': (
+            None if DB_CONN_MAX_AGE.lower() == 'none' else int(DB_CONN_MAX_AGE)
+        ),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', default='true').lower()
+            in ('true', '1', 'yes')
+        ),
+        # PgBouncer в режиме transaction не поддерживает серверные
+        # курсоры, которые Django использует для iterator().
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOLER == 'pgbouncer',
     }
 }
 
+# Кэш: по умолчанию в памяти процесса (LRU), для нескольких воркеров -
+# общий, например CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# и CACHE_LOCATION=redis://redis:6379/1.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.locmem.LocMemCache',
+)
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', default='')
+LOCMEM_CACHE = CACHE_BACKEND.endswith('LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': 'default' if LOCMEM_CACHE else CACHE_LOCATION,
+    },
+    'recipes': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': 'recipes' if LOCMEM_CACHE else CACHE_LOCATION,
+        'KEY_PREFIX': 'recipes',
+        'TIMEOUT': int(os.getenv('RECIPE_CACHE_TIMEOUT', default=3600)),
+        'OPTIONS': {'MAX_ENTRIES': 5000} if LOCMEM_CACHE else {},
+    },
+    # Токен авторизации -> пользователь, см. api.authentication. С
+    # кэшем в памяти процесса не используется.
+    'auth': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': 'auth' if LOCMEM_CACHE else CACHE_LOCATION,
+        'KEY_PREFIX': 'auth',
+        'TIMEOUT': int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=300)),
+        'OPTIONS': {'MAX_ENTRIES': 10000} if LOCMEM_CACHE else {},
+    },
+    # Метки версий из DataVersion, см. recipes.versions. С кэшем в
+    # памяти процесса не используется.
+    'versions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': 'versions' if LOCMEM_CACHE else CACHE_LOCATION,
+        'KEY_PREFIX': 'versions',
+        'TIMEOUT': int(os.getenv('VERSION_CACHE_TIMEOUT', default=600)),
+    },
+    # Итоги профилирования запросов, см. api.profiling. В locmem у
+    # каждого воркера свои.
+    'profiling': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': 'profiling' if LOCMEM_CACHE else CACHE_LOCATION,
+        'KEY_PREFIX': 'profiling',
+        'TIMEOUT': None,
+    },
+}
+
+# Доля профилируемых запросов, от 0 (выключено) до 1.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,10 +214,34 @@ REST_FRAMEWORK = {
     # ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ]
 }
 
+# Время жизни кэша COUNT(*) для пагинации в секундах, 0 - не кэшировать.
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=0)
+)
+
+# TTF-шрифт с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Миниатюры рецептов: потоков в пуле (0 - делать сразу), размер, качество.
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', default=2))
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_QUALITY = 80
+
+# Лента подписок: сколько рецептов хранится в ленте пользователя и сколько
+# последних рецептов автора попадает в неё при подписке. Рецепты авторов,
+# у которых FEED_FANOUT_LIMIT подписчиков и больше, по лентам не
+# раскладываются, а подмешиваются при чтении.
+FEED_LENGTH = int(os.getenv('FEED_LENGTH', default=300))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', default=30))
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=1000))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
@@ -4,7 +4,7 @@ from django.views.generic import TemplateView
 from rest_framework.routers import DefaultRouter
 
 from api.views import (
-    IngredientViewSet, RecipeViewSet, TagViewSet,
+    IngredientViewSet, ProfilingReportView, RecipeViewSet, TagViewSet,
 )
 from users.views import CustomUserViewSet
 
@@ -17,6 +17,7 @@ router_v1.register('users', CustomUserViewSet, basename='users')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/profiling/', ProfilingReportView.as_view()),
     path('api/', include(router_v1.urls)),
     path('api/', include('djoser.urls')),
     re_path(r'^api/auth/', include('djoser.urls.authtoken')),
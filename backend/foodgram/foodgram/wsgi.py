@@ -5,3 +5,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from recipes.nutrition import nutrition_matrix  # noqa: E402
+from recipes.pantry import pantry_index  # noqa: E402
+from recipes.search import ingredient_index  # noqa: E402
+
+ingredient_index.warm()
+nutrition_matrix.warm()
+pantry_index.warm()
@@ -0,0 +1,30 @@
+"""Настройки gunicorn, переопределяются переменными окружения."""
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+# Кэш в памяти процесса (CACHE_BACKEND по умолчанию, см. settings) у
+# каждого воркера свой: инвалидация в одном не видна другим. Поэтому с
+# ним воркер один, а масштабируются потоками.
+locmem_cache = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+).endswith('LocMemCache')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS',
+    1 if locmem_cache else multiprocessing.cpu_count() * 2 + 1
+))
+# Потоки внутри воркера: ожидание БД и медленных клиентов не блокирует
+# весь процесс. У каждого потока своё постоянное соединение с БД, так что
+# всего их до workers * threads - это нужно учесть в max_connections
+# PostgreSQL или в размере пула PgBouncer.
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Для ASGI: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker.
+worker_class = os.getenv(
+    'GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync'
+)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Периодический перезапуск воркеров от утечек памяти.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('GUNICORN_ACCESSLOG', None)
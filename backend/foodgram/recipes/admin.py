@@ -11,7 +11,8 @@ class IngredientInRecipeInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'id',)
+    list_display = ('name', 'author', 'id', 'favorites_count',
+                    'carts_count',)
     list_filter = ('name', 'author', 'tags',)
     empty_value_display = '-пусто-'
     inlines = [
@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import time
+from itertools import cycle
+
+from django.core.management.base import CommandError
+from django.test import AsyncClient, override_settings
+
+from .loadtest import DEFAULT_PATHS, ClientSender, percentile
+from .loadtest import Command as LoadtestCommand
+
+
+class Command(LoadtestCommand):
+    help = ('Сравнивает под конкурентной нагрузкой синхронные вьюсеты '
+            '(потоки, как gthread) и асинхронные вьюхи чтения (задачи '
+            'asyncio, как uvicorn) в этом же процессе')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Путь для запросов, можно указать несколько раз',
+        )
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность каждого прогона, секунд',
+        )
+        parser.add_argument('--token', help='Токен авторизации')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        sync_result = self.run(
+            lambda: ClientSender(headers), paths,
+            options['concurrency'], options['duration'],
+        )
+        self.report('WSGI, потоки', sync_result)
+        with override_settings(ROOT_URLCONF='foodgram.asgi_urls'):
+            async_result = asyncio.run(self.arun(
+                headers, paths, options['concurrency'], options['duration'],
+            ))
+        self.report('ASGI, asyncio', async_result)
+        self.stdout.write(self.style.SUCCESS(
+            'Разница RPS: '
+            f'{(async_result["rps"] / sync_result["rps"] - 1) * 100:+.0f}%'
+        ))
+
+    async def arun(self, headers, paths, concurrency, duration):
+        deadline = time.monotonic() + duration
+
+        async def worker(offset):
+            client = AsyncClient(headers=headers)
+            latencies, errors = [], 0
+            requests = cycle(paths[offset % len(paths):]
+                             + paths[:offset % len(paths)])
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    status = (await client.get(next(requests))).status_code
+                except Exception:
+                    status = None
+                latencies.append(time.perf_counter() - started)
+                if status is None or status >= 400:
+                    errors += 1
+            return latencies, errors
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(
+            worker(offset) for offset in range(concurrency)
+        ))
+        elapsed = time.monotonic() - started
+        latencies = sorted(
+            latency for own_latencies, _ in results
+            for latency in own_latencies
+        )
+        if not latencies:
+            raise CommandError('Ни один запрос не выполнен.')
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors for _, errors in results),
+            'rps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+        }
@@ -0,0 +1,328 @@
+import gc
+import io
+import random
+import statistics
+import time
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.management.bench import rolled_back
+from recipes.models import (
+    Favorite, FeedItem, Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+    ShoppingListItem, Tag
+)
+from recipes.search import update_search_index
+from recipes.similarity import compute_similar
+from users.models import Subscription
+
+User = get_user_model()
+
+TAG_COUNT = 8
+PAGE_LIMIT = 20
+
+# Эндпоинт, его бюджет запросов к БД и p95 задержки. client - 'anon',
+# 'reader' (много избранного, корзина, подписки) или 'author'.
+# paged: число запросов не должно зависеть от размера страницы.
+# Первый проход учитывает и построение индексов процесса в памяти.
+# Метки версий (DataVersion) читаются одним запросом за запрос.
+# save: сохранить id созданного объекта под этим именем для следующих
+# шагов; в path подставляются {recipe}, {author}, {tag} и т.п.
+Case = namedtuple(
+    'Case',
+    ('name', 'method', 'path', 'max_queries', 'p95_ms', 'client', 'data',
+     'status', 'paged', 'save'),
+    defaults=('reader', None, 200, False, None),
+)
+
+CASES = (
+    Case('рецепты, аноним', 'get', '/api/recipes/', 4, 60, 'anon',
+         paged=True),
+    Case('рецепты', 'get', '/api/recipes/', 4, 60, paged=True),
+    Case('рецепты по тегам', 'get',
+         '/api/recipes/?tags=bench0&tags=bench1', 6, 60, paged=True),
+    Case('рецепты в избранном', 'get', '/api/recipes/?is_favorited=1',
+         4, 60, paged=True),
+    Case('рецепты в корзине', 'get', '/api/recipes/?is_in_shopping_cart=1',
+         4, 60, paged=True),
+    Case('рецепты автора', 'get', '/api/recipes/?author={author}', 5, 60,
+         paged=True),
+    Case('поиск рецептов', 'get', '/api/recipes/?search=рецепт', 4, 80,
+         paged=True),
+    Case('лента подписок', 'get', '/api/recipes/feed/', 5, 60, paged=True),
+    Case('рецепт', 'get', '/api/recipes/{recipe}/', 5, 40),
+    Case('рецепт, аноним', 'get', '/api/recipes/{recipe}/', 3, 40, 'anon'),
+    Case('похожие рецепты', 'get', '/api/recipes/{recipe}/similar/', 1, 40,
+         'anon'),
+    Case('создание рецепта', 'post', '/api/recipes/', 22, 150, 'author',
+         data='new_recipe', status=201, save='created'),
+    # Ответ собирается заново: ключ кэша рецепта включает Recipe.modified.
+    Case('изменение рецепта', 'patch', '/api/recipes/{created}/', 22, 150,
+         'author', data='new_recipe'),
+    Case('удаление рецепта', 'delete', '/api/recipes/{created}/', 17, 100,
+         'author', status=204),
+    Case('в избранное', 'post', '/api/recipes/{free_recipe}/favorite/',
+         5, 60, status=201),
+    Case('из избранного', 'delete', '/api/recipes/{free_recipe}/favorite/',
+         4, 60, status=201),
+    Case('в корзину', 'post', '/api/recipes/{free_recipe}/shopping_cart/',
+         6, 60, status=201),
+    Case('из корзины', 'delete',
+         '/api/recipes/{free_recipe}/shopping_cart/', 5, 60, status=201),
+    Case('в избранное пачкой', 'post', '/api/recipes/favorite/', 5, 60,
+         data='free_recipes', status=201),
+    Case('из избранного пачкой', 'delete', '/api/recipes/favorite/', 4, 60,
+         data='free_recipes', status=204),
+    # Журнал изменений индекса; первый запрос ещё и строит индекс.
+    Case('что приготовить', 'post', '/api/recipes/pantry/', 5, 60,
+         data='pantry', paged=True),
+    Case('корзина с калорийностью', 'get', '/api/recipes/shopping_cart/',
+         3, 60),
+    Case('список покупок', 'get', '/api/recipes/download_shopping_cart/',
+         1, 100),
+    Case('список покупок, pdf', 'get',
+         '/api/recipes/download_shopping_cart/?format=pdf', 1, 300),
+    Case('пользователи', 'get', '/api/users/', 2, 60, paged=True),
+    Case('пользователь', 'get', '/api/users/{author}/', 1, 40),
+    Case('текущий пользователь', 'get', '/api/users/me/', 1, 40),
+    Case('подписки', 'get', '/api/users/subscriptions/?recipes_limit=3',
+         3, 80, paged=True),
+    Case('подписаться', 'post', '/api/users/{free_author}/subscribe/',
+         7, 60, status=201),
+    Case('отписаться', 'delete', '/api/users/{free_author}/subscribe/',
+         5, 60, status=201),
+    Case('теги', 'get', '/api/tags/', 2, 30),
+    Case('тег', 'get', '/api/tags/{tag}/', 2, 30),
+    Case('ингредиенты', 'get', '/api/ingredients/', 2, 100),
+    Case('поиск ингредиентов', 'get', '/api/ingredients/?name=bench1', 1,
+         30),
+    Case('ингредиент', 'get', '/api/ingredients/{ingredient}/', 2, 30),
+)
+
+
+class Command(BaseCommand):
+    help = ('Проходит все эндпоинты API на синтетических данных и падает, '
+            'если число запросов к БД или p95 задержки выше бюджета')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=300)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+        )
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнять каждый запрос',
+        )
+        parser.add_argument(
+            '--latency-factor', type=float, default=1,
+            help='Множитель бюджетов задержки для медленных машин, '
+                 '0 - не проверять задержку',
+        )
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            failures = self.run(options)
+        if failures:
+            raise CommandError(
+                'Превышены бюджеты:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('OK'))
+
+    def run(self, options):
+        started = time.monotonic()
+        ids = self.make_data(options)
+        self.stdout.write(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'
+        )
+        clients = {'anon': APIClient()}
+        for name in ('reader', 'author'):
+            clients[name] = APIClient()
+            clients[name].force_authenticate(
+                User.objects.get(pk=ids[name])
+            )
+
+        queries = {case: [] for case in CASES}
+        latencies = {case: [] for case in CASES}
+        # Первый проход прогревает кэши: его запросы к БД учитываются,
+        # задержка - нет.
+        for repeat in range(options['repeat'] + 1):
+            # Шаги идут по порядку: созданное удаляется, добавленное
+            # убирается, и каждый повтор начинается с тех же данных.
+            for case in CASES:
+                count, latency = self.request(clients[case.client], case, ids)
+                queries[case].append(count)
+                if repeat:
+                    latencies[case].append(latency)
+
+        failures = []
+        for case in CASES:
+            p95 = sorted(latencies[case])[
+                min(len(latencies[case]) - 1,
+                    int(len(latencies[case]) * 0.95))
+            ] * 1000
+            most = max(queries[case])
+            line = (
+                f'{case.name}: запросов {most} (бюджет {case.max_queries}), '
+                f'медиана {statistics.median(latencies[case]) * 1000:.1f} '
+                f'мс, p95 {p95:.1f} мс (бюджет {case.p95_ms} мс)'
+            )
+            self.stdout.write(line)
+            if most > case.max_queries:
+                failures.append(line)
+            elif (options['latency_factor']
+                  and p95 > case.p95_ms * options['latency_factor']):
+                failures.append(line)
+            if case.paged:
+                # Сравниваем с прогретым кэшем, чтобы не считать промахи.
+                client = clients[case.client]
+                full = self.request(client, case, ids)[0]
+                single = self.request(client, case, ids, limit=1)[0]
+                if full > single:
+                    failures.append(
+                        f'{case.name}: на странице из {PAGE_LIMIT} '
+                        f'запросов {full}, из одного - {single} (N+1)'
+                    )
+        return failures
+
+    def request(self, client, case, ids, limit=PAGE_LIMIT):
+        path = case.path.format(**ids)
+        data = ids.get(case.data)
+        if case.paged:
+            path += ('&' if '?' in path else '?') + f'limit={limit}'
+        # Паузы сборщика мусора от накопленного другими шагами мусора
+        # дают случайные выбросы задержки; собираем его заранее.
+        gc.collect()
+        gc.disable()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, case.method)(
+                    path, data, format='json',
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latency = time.perf_counter() - started
+        finally:
+            gc.enable()
+        if response.status_code != case.status:
+            raise CommandError(
+                f'{case.name}: {case.method.upper()} {path} вернул '
+                f'{response.status_code}, ожидался {case.status}'
+            )
+        if case.save:
+            ids[case.save] = response.json()['id']
+        return len(context), latency
+
+    def make_data(self, options):
+        rng = random.Random(0)
+        users = User.objects.bulk_create(
+            User(username=f'bench_user{i}', email=f'bench_user{i}@example.com')
+            for i in range(options['users'])
+        )
+        reader, author, free_author = users[0], users[1], users[-1]
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench{i}', slug=f'bench{i}', hexcolor=f'#00000{i}')
+            for i in range(TAG_COUNT)
+        )
+        # У части ингредиентов характеристики неизвестны.
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'bench{i}', measurement_unit='г',
+                **({} if i % 4 == 0 else {
+                    'calories': rng.uniform(0, 9),
+                    'proteins': rng.uniform(0, 0.3),
+                    'fats': rng.uniform(0, 0.5),
+                    'carbohydrates': rng.uniform(0, 0.8),
+                    'price': rng.uniform(0.01, 2),
+                }),
+            )
+            for i in range(options['ingredients'])
+        )
+        authors = users[1:-1] or [author]
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=rng.choice(authors), name=f'bench{i}',
+                   text='Синтетический рецепт', cooking_time=10)
+            for i in range(options['recipes'])
+        )
+        free_recipe = recipes.pop()
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients, min(len(ingredients),
+                                 options['ingredients_per_recipe'])
+            )
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, 3))
+        )
+        favorites = min(options['favorites'], len(recipes))
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipe)
+            for user in users
+            for recipe in rng.sample(recipes, favorites)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipe)
+            for user in users
+            for recipe in rng.sample(recipes, favorites // 2)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=user, author=followed)
+            for user in users
+            for followed in rng.sample(
+                [other for other in authors if other != user],
+                min(options['subscriptions'], len(authors) - 1),
+            )
+        )
+        update_search_index([recipe.id for recipe in recipes])
+        compute_similar(timezone.now(), full=True)
+        call_command('rebuild_counters', stdout=io.StringIO())
+        ShoppingListItem.objects.rebuild([user.id for user in users])
+        FeedItem.objects.rebuild([user.id for user in users])
+        # Без статистики по новым строкам планировщик считает таблицы
+        # пустыми и соединяет их вложенным циклом без индексов.
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        return {
+            'reader': reader.id,
+            'author': author.id,
+            'free_author': free_author.id,
+            'recipe': recipes[0].id,
+            'free_recipe': free_recipe.id,
+            'free_recipes': {'recipes': [free_recipe.id]},
+            'pantry': {
+                'ingredients': [
+                    ingredient.id for ingredient in ingredients[:20]
+                ],
+                'exclude': [ingredients[-1].id],
+            },
+            'tag': tags[0].id,
+            'ingredient': ingredients[0].id,
+            'new_recipe': {
+                'name': 'bench_new',
+                'text': 'Новый рецепт',
+                'cooking_time': 5,
+                'tags': [tag.id for tag in tags[:2]],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in ingredients[:5]
+                ],
+            },
+        }
@@ -0,0 +1,136 @@
+import random
+import statistics
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filterset import RecipeFilter
+from recipes.management.bench import rolled_back
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+User = get_user_model()
+
+TAG_COUNT = 8
+AUTHOR_COUNT = 1000
+PAGE_SIZE = 6
+
+COMBINATIONS = (
+    {},
+    {'tags': ['bench0']},
+    {'tags': ['bench0', 'bench1', 'bench2']},
+    {'is_favorited': '1'},
+    {'is_in_shopping_cart': '1'},
+    {'is_favorited': '1', 'is_in_shopping_cart': '1'},
+    {'is_favorited': '1', 'tags': ['bench0', 'bench1']},
+    {'author': None, 'tags': ['bench3']},
+    {'author': None, 'is_favorited': '1', 'tags': ['bench0', 'bench1']},
+)
+
+
+class Command(BaseCommand):
+    help = ('Замеряем время фильтрации списка рецептов по тегам, '
+            'избранному и корзине на синтетических данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1_000_000,
+            help='Сколько синтетических рецептов создать',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз выполнять каждую комбинацию фильтров',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10_000,
+            help='Размер пачки для bulk_create',
+        )
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Печатать план запроса страницы',
+        )
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options)
+
+    def run(self, options):
+        started = time.monotonic()
+        reader, author = self.make_data(
+            options['recipes'], options['batch_size']
+        )
+        self.stdout.write(
+            f'Данные созданы за {time.monotonic() - started:.1f} с'
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        factory = APIRequestFactory()
+        for params in COMBINATIONS:
+            params = {
+                key: author.id if value is None else value
+                for key, value in params.items()
+            }
+            request = Request(factory.get('/api/recipes/', params))
+            request.user = reader
+            timings = []
+            for _ in range(options['repeat']):
+                begin = time.perf_counter()
+                queryset = RecipeFilter(
+                    request.query_params, queryset=Recipe.objects.all(),
+                    request=request,
+                ).qs.order_by('-pub_date', '-id')
+                count = queryset.count()
+                list(queryset.values_list('id', flat=True)[:PAGE_SIZE])
+                timings.append(time.perf_counter() - begin)
+            self.stdout.write(
+                f'{params}: найдено {count}, медиана '
+                f'{statistics.median(timings) * 1000:.1f} мс, максимум '
+                f'{max(timings) * 1000:.1f} мс'
+            )
+            if options['explain']:
+                self.stdout.write(
+                    queryset.values('id')[:PAGE_SIZE].explain()
+                )
+
+    def make_data(self, count, batch_size):
+        rng = random.Random(0)
+        reader = User.objects.create(
+            username='bench_reader', email='bench_reader@example.com',
+        )
+        authors = User.objects.bulk_create(
+            User(username=f'bench_author{i}',
+                 email=f'bench_author{i}@example.com')
+            for i in range(AUTHOR_COUNT)
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench{i}', slug=f'bench{i}', hexcolor=f'#00000{i}')
+            for i in range(TAG_COUNT)
+        )
+        recipes = (
+            Recipe(author=rng.choice(authors), name=f'bench{i}', text='-',
+                   cooking_time=1)
+            for i in range(count)
+        )
+        while True:
+            batch = Recipe.objects.bulk_create(islice(recipes, batch_size))
+            if not batch:
+                return reader, authors[0]
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=recipe, tag=tag)
+                for recipe in batch
+                for tag in rng.sample(tags, rng.randint(1, 3))
+            )
+            Favorite.objects.bulk_create(
+                Favorite(user=reader, recipe=recipe)
+                for recipe in batch if rng.random() < 0.01
+            )
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=reader, recipe=recipe)
+                for recipe in batch if rng.random() < 0.005
+            )
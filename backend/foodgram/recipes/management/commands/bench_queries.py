@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.management.bench import rolled_back
+from recipes.models import (
+    Favorite, Ingredient, IngredientInRecipe,
+    Recipe, ShoppingCart, Tag
+)
+from recipes.search import update_search_index
+from users.models import Subscription
+
+User = get_user_model()
+
+# COUNT, страница, теги и ингредиенты страницы.
+RECIPE_LIST_MAX_QUERIES = 4
+
+
+class Command(BaseCommand):
+    help = ('Проверяем, что число запросов к списку рецептов '
+            'не зависит от размера страницы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=40,
+            help='Сколько синтетических рецептов создать',
+        )
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.run(options['recipes'])
+
+    def make_data(self, count):
+        author = User.objects.create(
+            username='bench_author', email='bench_author@example.com',
+        )
+        reader = User.objects.create(
+            username='bench_reader', email='bench_reader@example.com',
+        )
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench{i}', slug=f'bench{i}', hexcolor=f'#00000{i}')
+            for i in range(3)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench{i}', measurement_unit='г')
+            for i in range(5)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'bench{i}', text='-', cooking_time=1)
+            for i in range(count)
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes
+            for ingredient in ingredients
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in tags
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=reader, recipe=recipe) for recipe in recipes[::2]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=reader, recipe=recipe)
+            for recipe in recipes[::3]
+        )
+        Subscription.objects.create(user=reader, author=author)
+        update_search_index([recipe.id for recipe in recipes])
+        return reader
+
+    def count_queries(self, client, limit):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/recipes/', {'limit': limit})
+        if response.status_code != 200:
+            raise CommandError(
+                f'/api/recipes/ вернул {response.status_code}'
+            )
+        return len(context)
+
+    def run(self, count):
+        reader = self.make_data(count)
+        anonymous = APIClient()
+        authorized = APIClient()
+        authorized.force_authenticate(reader)
+
+        for name, client in (('аноним', anonymous),
+                             ('пользователь', authorized)):
+            counts = [self.count_queries(client, limit) for limit in (1, 20)]
+            self.stdout.write(f'{name}: запросов на страницу {counts}')
+            if max(counts) > RECIPE_LIST_MAX_QUERIES:
+                raise CommandError(
+                    f'{name}: {max(counts)} запросов, '
+                    f'допустимо {RECIPE_LIST_MAX_QUERIES}'
+                )
+            if len(set(counts)) > 1:
+                raise CommandError(
+                    f'{name}: число запросов растёт с размером страницы'
+                )
+        self.stdout.write(self.style.SUCCESS('OK'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.similarity import TOP_K, compute_similar
+
+
+class Command(BaseCommand):
+    help = ('Рассчитываем похожие рецепты по ингредиентам и тегам. '
+            'По умолчанию - только для изменённых с прошлого запуска')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты (нужно после смены --top-k и '
+                 'правок тегов или ингредиентов мимо API)',
+        )
+        parser.add_argument('--top-k', type=int, default=TOP_K)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        # Изменения во время расчёта попадут в следующий запуск.
+        stats = compute_similar(
+            timezone.now(), options['top_k'], options['full'],
+        )
+        self.stdout.write(
+            f'Рецептов {stats["recipes"]}, изменились '
+            f'{stats.get("changed", stats["recipes"])}, пересчитаны '
+            f'{stats["recomputed"]}, дополнены {stats["merged"]} за '
+            f'{time.monotonic() - started:.1f} с.'
+        )
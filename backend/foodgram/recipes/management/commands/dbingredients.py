@@ -1,30 +1,224 @@
 import csv
+import io
+import json
+import math
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient
+from recipes.nutrition import NUTRIENTS
+from recipes.versions import INGREDIENTS, bump_version
+
+MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки: название, единица измерения и, необязательно,
+    калорийность, белки, жиры, углеводы и цена на единицу."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1], row[2:2 + len(NUTRIENTS)]
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if buffer[position:].strip():
+                    raise CommandError('Некорректный JSON-файл.')
+                return
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item['name'], item['measurement_unit'], [
+            item.get(nutrient) for nutrient in NUTRIENTS
+        ]
+
+
+def parse_values(values):
+    """Характеристики ингредиента: числа не меньше нуля или None."""
+    values = list(values) + [None] * (len(NUTRIENTS) - len(values))
+    parsed = []
+    for value in values:
+        if isinstance(value, str):
+            value = value.strip().replace(',', '.') or None
+        if value is not None:
+            value = float(value)
+            if not (math.isfinite(value) and value >= 0):
+                raise ValueError(value)
+        parsed.append(value)
+    return parsed
+
+
+class CsvStream(io.RawIOBase):
+    """Файлоподобный объект для COPY: отдаёт строки CSV по мере чтения."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = bytearray()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            writer.writerow(row)
+            self.buffer += output.getvalue().encode()
+            output.seek(0)
+            output.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        data = self.buffer[:size]
+        del self.buffer[:size]
+        return bytes(data)
 
 
 class Command(BaseCommand):
-    help = 'Загружаем базу данных игридиентов из csv'
+    help = 'Загружаем базу данных игридиентов из csv или json'
 
     def add_arguments(self, parser):
-        parser.add_argument('--path', type=str, help='Путь к файлу')
+        parser.add_argument(
+            '--path', type=str, default='',
+            help='Путь к папке с ingredients.csv',
+        )
+        parser.add_argument(
+            '--file', type=str,
+            help='Путь к файлу .csv или .json (вместо --path)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пачки для bulk_create',
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY на PostgreSQL',
+        )
 
     def handle(self, *args, **options):
-        file_path = options['path'] + 'ingredients.csv'
-        with open(file_path, 'r', encoding='utf=8') as csv_file:
-            reader = csv.reader(csv_file)
-
-            for row in reader:
-                try:
-                    obj, created = Ingredient.objects.get_or_create(
-                        name=row[0],
-                        measurement_unit=row[1],
-                    )
-                    if not created:
-                        print(
-                            f'Ингредиент {obj} уже существует в базе данных.'
-                        )
-                except Exception as error:
-                    print(f'Ошибка в строке {row}: {error}')
+        file_path = options['file'] or options['path'] + 'ingredients.csv'
+        reader = read_json if file_path.endswith('.json') else read_csv
+        self.read = self.skipped = self.with_values = 0
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+
+        with open(file_path, 'r', encoding='utf-8') as file:
+            rows = self.unique(reader(file))
+            with transaction.atomic():
+                if connection.vendor == 'postgresql' and not options[
+                    'no_copy'
+                ]:
+                    self.load_copy(rows)
+                else:
+                    self.load_bulk(rows, options['batch_size'])
+        bump_version(INGREDIENTS)
+
+        elapsed = time.monotonic() - started
+        created = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {self.read}, пропущено: {self.skipped}, '
+            f'добавлено ингредиентов: {created}, '
+            f'с характеристиками: {self.with_values} '
+            f'за {elapsed:.2f} с ({self.read / max(elapsed, 1e-6):.0f} '
+            f'строк/с).'
+        ))
+
+    def unique(self, rows):
+        seen = set()
+        for name, measurement_unit, values in rows:
+            self.read += 1
+            key = (name.strip(), measurement_unit.strip())
+            try:
+                values = parse_values(values)
+            except ValueError:
+                values = None
+            if (
+                values is None
+                or key in seen
+                or not all(key)
+                or max(map(len, key)) > MAX_LENGTH
+            ):
+                self.skipped += 1
+                continue
+            seen.add(key)
+            if any(value is not None for value in values):
+                self.with_values += 1
+            yield (*key, *values)
+
+    def load_bulk(self, rows, batch_size):
+        while True:
+            batch = [
+                Ingredient(
+                    name=name, measurement_unit=measurement_unit,
+                    **dict(zip(NUTRIENTS, values)),
+                )
+                for name, measurement_unit, *values in islice(
+                    rows, batch_size
+                )
+            ]
+            if not batch:
+                return
+            with_values, without_values = [], []
+            for ingredient in batch:
+                if any(getattr(ingredient, nutrient) is not None
+                       for nutrient in NUTRIENTS):
+                    with_values.append(ingredient)
+                else:
+                    without_values.append(ingredient)
+            # Строка с характеристиками перезаписывает их у имеющегося
+            # ингредиента, строка без них его не трогает.
+            Ingredient.objects.bulk_create(
+                with_values, update_conflicts=True,
+                unique_fields=('name', 'measurement_unit'),
+                update_fields=NUTRIENTS,
+            )
+            Ingredient.objects.bulk_create(
+                without_values, ignore_conflicts=True,
+            )
+
+    def load_copy(self, rows):
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            columns = ', '.join(NUTRIENTS)
+            excluded = ', '.join(
+                f'EXCLUDED.{nutrient}' for nutrient in NUTRIENTS
+            )
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_load '
+                '(name varchar(200), measurement_unit varchar(200), '
+                + ', '.join(f'{nutrient} double precision'
+                            for nutrient in NUTRIENTS)
+                + ') ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_load FROM STDIN WITH (FORMAT csv)',
+                CsvStream(rows),
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit, {columns}) '
+                f'SELECT name, measurement_unit, {columns} '
+                'FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO UPDATE SET '
+                + ', '.join(f'{nutrient} = EXCLUDED.{nutrient}'
+                            for nutrient in NUTRIENTS)
+                + f' WHERE COALESCE({excluded}) IS NOT NULL'
+            )
@@ -0,0 +1,101 @@
+import gzip
+import json
+import sys
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import IngredientInRecipe, Recipe
+
+
+def open_jsonl(path, mode):
+    """Файл JSON Lines: '-' - stdin/stdout, .gz - со сжатием."""
+    if path == '-':
+        return nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def grouped(rows):
+    """{recipe_id: [остаток строки]} из строк, начинающихся с recipe_id."""
+    groups = defaultdict(list)
+    for recipe_id, *rest in rows:
+        groups[recipe_id].append(rest)
+    return groups
+
+
+class Command(BaseCommand):
+    help = ('Выгружаем рецепты в JSON Lines: по рецепту в строке, автор, '
+            'теги и ингредиенты - по естественным ключам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file', nargs='?', default='-',
+            help='Файл .jsonl или .jsonl.gz, по умолчанию stdout',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = 0
+        with open_jsonl(options['file'], 'w') as file:
+            for batch in self.batches(options['batch_size']):
+                file.writelines(
+                    json.dumps(recipe, ensure_ascii=False) + '\n'
+                    for recipe in batch
+                )
+                count += len(batch)
+        # stdout может быть занят самой выгрузкой.
+        self.stderr.write(
+            f'Выгружено рецептов: {count} за '
+            f'{time.monotonic() - started:.1f} с.'
+        )
+
+    def batches(self, batch_size):
+        """Рецепты пачками по возрастанию id, без OFFSET."""
+        last_id = 0
+        while True:
+            recipes = list(Recipe.objects.filter(
+                pk__gt=last_id,
+            ).order_by('pk').values_list(
+                'pk', 'author__username', 'name', 'text', 'cooking_time',
+                'pub_date', 'image', 'thumbnail',
+            )[:batch_size])
+            if not recipes:
+                return
+            last_id = recipes[-1][0]
+            ids = [recipe[0] for recipe in recipes]
+            tags = grouped(Recipe.tags.through.objects.filter(
+                recipe_id__in=ids,
+            ).order_by('recipe_id', 'tag_id').values_list(
+                'recipe_id', 'tag__slug',
+            ))
+            ingredients = grouped(IngredientInRecipe.objects.filter(
+                recipe_id__in=ids,
+            ).order_by('recipe_id', 'pk').values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount',
+            ))
+            yield [
+                {
+                    'author': author,
+                    'name': name,
+                    'text': text,
+                    'cooking_time': cooking_time,
+                    'pub_date': pub_date.isoformat(),
+                    'tags': [slug for slug, in tags[pk]],
+                    'ingredients': [
+                        {'name': ingredient, 'measurement_unit': unit,
+                         'amount': amount}
+                        for ingredient, unit, amount in ingredients[pk]
+                    ],
+                    # Картинки - ссылками на файлы в хранилище.
+                    'image': image or None,
+                    'thumbnail': thumbnail or None,
+                }
+                for (pk, author, name, text, cooking_time, pub_date, image,
+                     thumbnail) in recipes
+            ]
@@ -0,0 +1,183 @@
+import json
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import (
+    FeedItem, Ingredient, IngredientInRecipe, Recipe, Tag
+)
+from recipes.pantry import recipe_ingredients_changed
+from recipes.search import update_search_index
+
+from .export_recipes import open_jsonl
+from .rebuild_counters import count_of
+
+User = get_user_model()
+
+MAX_NAME_LENGTH = Recipe._meta.get_field('name').max_length
+MAX_SMALL_INTEGER = 32767
+
+
+@contextmanager
+def explicit_pub_date():
+    """bulk_create ставит полю с auto_now_add текущее время; на время
+    загрузки дата публикации берётся из файла."""
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def small_positive(value):
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and 1 <= value <= MAX_SMALL_INTEGER
+    )
+
+
+class Command(BaseCommand):
+    help = ('Загружаем рецепты из JSON Lines (формат export_recipes) '
+            'пачками bulk_create. Рецепты добавляются к имеющимся')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file', nargs='?', default='-',
+            help='Файл .jsonl или .jsonl.gz, по умолчанию stdin',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('pk', 'name', 'measurement_unit')
+        }
+        self.authors = {}
+        self.touched_authors = set()
+        self.created = self.skipped = 0
+        try:
+            with open_jsonl(options['file'], 'r') as file:
+                with explicit_pub_date():
+                    lines = self.parse(file)
+                    while True:
+                        batch = list(islice(lines, options['batch_size']))
+                        if not batch:
+                            break
+                        self.load(batch)
+        finally:
+            # Счётчики рецептов у авторов уже загруженных пачек.
+            authors = list(self.touched_authors)
+            for start in range(0, len(authors), options['batch_size']):
+                User.objects.filter(
+                    pk__in=authors[start:start + options['batch_size']],
+                ).update(recipes_count=count_of(Recipe, 'author'))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {self.created}, пропущено: '
+            f'{self.skipped} за {elapsed:.1f} с '
+            f'({self.created / max(elapsed, 1e-6):.0f} рецептов/с).'
+        ))
+
+    def parse(self, file):
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise CommandError(f'Строка {number}: {error}')
+            if not isinstance(item, dict):
+                raise CommandError(f'Строка {number}: ожидался объект.')
+            yield item
+
+    def resolve(self, item):
+        """Рецепт и его связи по естественным ключам или None, если
+        рецепт неполный или ссылается на неизвестные данные."""
+        try:
+            author_id = self.authors[item['author']]
+            tag_ids = {self.tags[slug] for slug in item['tags']}
+            amounts = {}
+            for ingredient in item['ingredients']:
+                ingredient_id = self.ingredients[(
+                    ingredient['name'], ingredient['measurement_unit']
+                )]
+                if (ingredient_id in amounts
+                        or not small_positive(ingredient['amount'])):
+                    return None
+                amounts[ingredient_id] = ingredient['amount']
+            name, text = item['name'], item['text']
+            pub_date = parse_datetime(item.get('pub_date') or '')
+            image, thumbnail = item.get('image'), item.get('thumbnail')
+        except (KeyError, TypeError, ValueError):
+            return None
+        if (
+            not isinstance(image or '', str)
+            or not isinstance(thumbnail or '', str)
+            or not isinstance(name, str) or not isinstance(text, str)
+            or not name or len(name) > MAX_NAME_LENGTH
+            or not small_positive(item.get('cooking_time'))
+        ):
+            return None
+        if pub_date is None:
+            pub_date = timezone.now()
+        elif settings.USE_TZ and timezone.is_naive(pub_date):
+            pub_date = timezone.make_aware(pub_date)
+        recipe = Recipe(
+            author_id=author_id, name=name, text=text,
+            cooking_time=item['cooking_time'], pub_date=pub_date,
+            image=image or None, thumbnail=thumbnail or None,
+        )
+        return recipe, tag_ids, amounts
+
+    def load(self, batch):
+        missing = {
+            item.get('author') for item in batch
+            if isinstance(item.get('author'), str)
+        } - self.authors.keys()
+        if missing:
+            self.authors.update(User.objects.filter(
+                username__in=missing,
+            ).values_list('username', 'pk'))
+        resolved = [
+            recipe for recipe in map(self.resolve, batch)
+            if recipe is not None
+        ]
+        self.skipped += len(batch) - len(resolved)
+        if not resolved:
+            return
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create(
+                recipe for recipe, _, _ in resolved
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe, tag_ids, _ in resolved
+                for tag_id in tag_ids
+            )
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for recipe, _, amounts in resolved
+                for ingredient_id, amount in amounts.items()
+            )
+            ids = [recipe.pk for recipe in recipes]
+            # bulk_create не отправляет сигналы.
+            update_search_index(ids)
+            recipe_ingredients_changed(ids)
+            FeedItem.objects.fan_out(ids)
+        self.touched_authors.update(
+            recipe.author_id for recipe, _, _ in resolved
+        )
+        self.created += len(recipes)
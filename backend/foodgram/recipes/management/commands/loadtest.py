@@ -0,0 +1,192 @@
+import http.client
+import statistics
+import threading
+import time
+from itertools import cycle
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.test import Client
+
+DEFAULT_PATHS = ('/api/recipes/', '/api/tags/', '/api/ingredients/?name=са')
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class HttpSender:
+    """Запросы к запущенному серверу по keep-alive соединению."""
+
+    def __init__(self, url, headers):
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.headers = headers
+        self.connection = None
+
+    def __call__(self, path):
+        if self.connection is None:
+            self.connection = self.connection_class(self.netloc, timeout=30)
+        try:
+            self.connection.request(
+                'GET', self.prefix + path, headers=self.headers
+            )
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ClientSender:
+    """Запросы через Django test client в этом же процессе.
+
+    Test client отключает close_old_connections на время запроса,
+    поэтому после запроса она вызывается явно, как на сервере."""
+
+    def __init__(self, headers):
+        self.client = Client(**{
+            'HTTP_' + name.upper().replace('-', '_'): value
+            for name, value in headers.items()
+        })
+
+    def __call__(self, path):
+        try:
+            return self.client.get(path).status_code
+        finally:
+            close_old_connections()
+
+    def close(self):
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест GET-запросов: RPS и задержки. Без --url '
+            'сравнивает в этом процессе разные CONN_MAX_AGE')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', help='Адрес запущенного сервера, например '
+                          'http://127.0.0.1:8000',
+        )
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Путь для запросов, можно указать несколько раз',
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность каждого прогона, секунд',
+        )
+        parser.add_argument('--token', help='Токен авторизации')
+        parser.add_argument(
+            '--conn-max-age', default='0,60',
+            help='Значения CONN_MAX_AGE через запятую (без --url)',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+
+        if options['url']:
+            self.report(options['url'], self.run(
+                lambda: HttpSender(options['url'], headers), paths,
+                options['concurrency'], options['duration'],
+            ))
+            return
+
+        db_settings = connections.settings[connection.alias]
+        initial = db_settings.get('CONN_MAX_AGE')
+        results = []
+        try:
+            for value in options['conn_max_age'].split(','):
+                db_settings['CONN_MAX_AGE'] = (
+                    None if value.strip() == 'none' else int(value)
+                )
+                # Новые потоки откроют соединения с новым CONN_MAX_AGE.
+                result = self.run(
+                    lambda: ClientSender(headers), paths,
+                    options['concurrency'], options['duration'],
+                )
+                self.report(f'CONN_MAX_AGE={value.strip()}', result)
+                results.append(result['rps'])
+        finally:
+            db_settings['CONN_MAX_AGE'] = initial
+        if len(results) > 1 and results[0]:
+            self.stdout.write(self.style.SUCCESS(
+                f'Прирост RPS: {(results[-1] / results[0] - 1) * 100:+.0f}%'
+            ))
+
+    def run(self, make_sender, paths, concurrency, duration):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker(offset):
+            sender = make_sender()
+            own_latencies, own_errors = [], 0
+            requests = cycle(paths[offset % len(paths):]
+                             + paths[:offset % len(paths)])
+            try:
+                while time.monotonic() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        status = sender(next(requests))
+                    except Exception:
+                        status = None
+                    own_latencies.append(time.perf_counter() - started)
+                    if status is None or status >= 400:
+                        own_errors += 1
+            finally:
+                sender.close()
+            with lock:
+                latencies.extend(own_latencies)
+                errors.append(own_errors)
+
+        threads = [
+            threading.Thread(target=worker, args=(offset,))
+            for offset in range(concurrency)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        if not latencies:
+            raise CommandError('Ни один запрос не выполнен.')
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors),
+            'rps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+        }
+
+    def report(self, title, result):
+        self.stdout.write(
+            f'{title}: запросов {result["requests"]}, ошибок '
+            f'{result["errors"]}, {result["rps"]:.0f} RPS, '
+            f'p50 {result["p50"] * 1000:.1f} мс, '
+            f'p95 {result["p95"] * 1000:.1f} мс, '
+            f'p99 {result["p99"] * 1000:.1f} мс'
+        )
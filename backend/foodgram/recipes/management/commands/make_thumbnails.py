@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.thumbnails import make_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Создаём миниатюры для рецептов, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать миниатюры всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(thumbnail=None)
+        count = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            make_thumbnail(recipe_id)
+            count += 1
+        self.stdout.write(f'Обработано рецептов: {count}.')
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from api.profiling import report, reset_report
+
+COLUMNS = (
+    ('endpoint', 'эндпоинт'), ('requests', 'замеров'),
+    ('queries', 'запросов'), ('max_queries', 'макс.'),
+    ('serialize_queries', 'из сериализ.'), ('db_ms', 'БД, мс'),
+    ('serialize_ms', 'сериализ., мс'), ('total_ms', 'всего, мс'),
+    ('max_total_ms', 'макс., мс'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Худшие эндпоинты по данным выборочного профилирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--order', default='total_ms',
+            choices=[name for name, _ in COLUMNS[1:]],
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Сбросить накопленные итоги',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset_report()
+            self.stdout.write('Итоги профилирования сброшены.')
+            return
+        rows = report(options['order'], options['limit'])
+        if not rows:
+            self.stdout.write('Замеров нет: PROFILING_SAMPLE_RATE = 0?')
+            return
+        table = [[title for _, title in COLUMNS]] + [
+            [str(row[name]) for name, _ in COLUMNS] for row in rows
+        ]
+        widths = [max(map(len, column)) for column in zip(*table)]
+        for line in table:
+            self.stdout.write('  '.join(
+                cell.ljust(width) if index == 0 else cell.rjust(width)
+                for index, (cell, width) in enumerate(zip(line, widths))
+            ))
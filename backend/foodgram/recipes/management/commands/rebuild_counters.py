@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    """Подзапрос: сколько строк model ссылаются на строку через field."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитываем счётчики избранного, списков покупок, '
+            'рецептов и подписчиков')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.update(
+            favorites_count=count_of(Favorite, 'recipe'),
+            carts_count=count_of(ShoppingCart, 'recipe'),
+        )
+        users = User.objects.update(
+            recipes_count=count_of(Recipe, 'author'),
+            subscribers_count=count_of(Subscription, 'author'),
+        )
+        self.stdout.write(
+            f'Пересчитаны счётчики: рецептов {recipes}, '
+            f'пользователей {users}.'
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedItem
+from users.models import Subscription
+
+USER_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересобираем ленты подписок из подписок и рецептов авторов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя (можно указать несколько раз)',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        user_ids = options['users'] or list(
+            Subscription.objects.values_list(
+                'user_id', flat=True
+            ).distinct().order_by('user_id')
+        )
+        if not options['users']:
+            FeedItem.objects.all().delete()
+        for start in range(0, len(user_ids), USER_BATCH_SIZE):
+            FeedItem.objects.rebuild(
+                user_ids[start:start + USER_BATCH_SIZE]
+            )
+        self.stdout.write(
+            f'Пересобраны ленты подписок: {len(user_ids)} пользователей.'
+        )
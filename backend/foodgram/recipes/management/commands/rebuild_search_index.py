@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Пересчитываем поисковый индекс всех рецептов'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        update_search_index()
+        self.stdout.write('Поисковый индекс рецептов пересчитан.')
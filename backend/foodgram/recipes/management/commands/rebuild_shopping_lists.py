@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитываем сводные списки покупок из корзин пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя (можно указать несколько раз)',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        user_ids = options['users'] or list(
+            ShoppingCart.objects.values_list(
+                'user_id', flat=True
+            ).distinct().order_by()
+        )
+        if not options['users']:
+            ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.rebuild(user_ids)
+        self.stdout.write(
+            f'Пересчитаны списки покупок: {len(user_ids)} пользователей.'
+        )
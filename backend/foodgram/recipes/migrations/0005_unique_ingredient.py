@@ -0,0 +1,47 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:31
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit',
+    ).annotate(
+        keep=Min('id'), total=Count('id'),
+    ).filter(total__gt=1).order_by()
+    for row in duplicates:
+        extra = Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit'],
+        ).exclude(id=row['keep'])
+        IngredientInRecipe.objects.filter(
+            ingredient__in=extra,
+        ).update(ingredient_id=row['keep'])
+        for item in ShoppingListItem.objects.filter(ingredient__in=extra):
+            kept, _ = ShoppingListItem.objects.get_or_create(
+                user_id=item.user_id, ingredient_id=row['keep'],
+                defaults={'total_amount': 0},
+            )
+            kept.total_amount += item.total_amount
+            kept.save()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
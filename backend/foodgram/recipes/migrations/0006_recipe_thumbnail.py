@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail',
+            field=models.ImageField(blank=True, default=None, null=True, upload_to='photo/thumbnails/', verbose_name='Миниатюра'),
+        ),
+    ]
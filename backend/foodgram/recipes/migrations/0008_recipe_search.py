@@ -0,0 +1,62 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:37
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Ингредиенты рецепта одной строкой, для заполнения индекса.
+INGREDIENT_NAMES = (
+    '(SELECT {aggregate} FROM recipes_ingredientinrecipe ir '
+    'JOIN recipes_ingredient i ON i.id = ir.ingredient_id '
+    'WHERE ir.recipe_id = r.id)'
+)
+# Индекс заполняется для уже существующих рецептов, дальше его
+# обновляет recipes.search.update_search_index.
+FORWARD_SQL = {
+    'postgresql': (
+        'UPDATE recipes_recipe r SET search_vector = '
+        "setweight(to_tsvector('russian', COALESCE(r.name, '')), 'A') || "
+        "setweight(to_tsvector('russian', COALESCE("
+        + INGREDIENT_NAMES.format(aggregate="string_agg(i.name, ' ')")
+        + ", '')), 'B') || "
+        "setweight(to_tsvector('russian', COALESCE(r.text, '')), 'C')",
+        'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+        'USING gin (search_vector)',
+    ),
+    'sqlite': (
+        'CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5('
+        'name, text, ingredients, tokenize="unicode61 remove_diacritics 2")',
+        'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+        'SELECT r.id, r.name, r.text, COALESCE('
+        + INGREDIENT_NAMES.format(aggregate="group_concat(i.name, ' ')")
+        + ", '') FROM recipes_recipe r",
+    ),
+}
+BACKWARD_SQL = {
+    'postgresql': ('DROP INDEX IF EXISTS recipe_search_vector_idx',),
+    'sqlite': ('DROP TABLE IF EXISTS recipes_recipe_fts',),
+}
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_vendor_sql(FORWARD_SQL), run_vendor_sql(BACKWARD_SQL),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:42
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+MAX_AMOUNT = 32767
+
+
+def duplicates(model, *fields):
+    return model.objects.values(*fields).annotate(
+        keep=Min('id'), total=Count('id'),
+    ).filter(total__gt=1).order_by()
+
+
+def delete_duplicates(model, *fields):
+    """Оставляет первую из одинаковых строк, возвращает затронутые."""
+    rows = list(duplicates(model, *fields))
+    for row in rows:
+        model.objects.filter(
+            **{f'{field}_id': row[field] for field in fields}
+        ).exclude(id=row['keep']).delete()
+    return rows
+
+
+def rebuild_shopping_lists(apps, user_ids):
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    totals = IngredientInRecipe.objects.filter(
+        recipe__in_shopping_list__user_id__in=user_ids,
+    ).values(
+        'recipe__in_shopping_list__user_id', 'ingredient_id',
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=row['recipe__in_shopping_list__user_id'],
+            ingredient_id=row['ingredient_id'],
+            total_amount=row['total'],
+        )
+        for row in totals.iterator()
+    )
+
+
+def delete_duplicate_relations(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+
+    for row in delete_duplicates(Favorite, 'user', 'recipe'):
+        Recipe.objects.filter(pk=row['recipe']).update(
+            favorites_count=Favorite.objects.filter(
+                recipe_id=row['recipe'],
+            ).count(),
+        )
+    changed_users = set()
+    for row in delete_duplicates(ShoppingCart, 'user', 'recipe'):
+        changed_users.add(row['user'])
+        Recipe.objects.filter(pk=row['recipe']).update(
+            carts_count=ShoppingCart.objects.filter(
+                recipe_id=row['recipe'],
+            ).count(),
+        )
+
+    # Повторы ингредиента в рецепте складываются в одну строку.
+    for row in duplicates(IngredientInRecipe, 'recipe', 'ingredient'):
+        same = IngredientInRecipe.objects.filter(
+            recipe_id=row['recipe'], ingredient_id=row['ingredient'],
+        )
+        amount = same.aggregate(amount=Sum('amount'))['amount']
+        same.exclude(id=row['keep']).delete()
+        same.update(amount=min(amount, MAX_AMOUNT))
+        changed_users.update(ShoppingCart.objects.filter(
+            recipe_id=row['recipe'],
+        ).values_list('user_id', flat=True))
+
+    if changed_users:
+        rebuild_shopping_lists(apps, changed_users)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_relations, migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.2 on 2026-10-18 01:46
+
+import time
+
+from django.db import migrations, models
+
+
+def add_epoch(apps, schema_editor):
+    # Метка по умолчанию для данных, которые ещё не менялись: старые
+    # ETag и Last-Modified из кэша после перехода недействительны.
+    DataVersion = apps.get_model('recipes', 'DataVersion')
+    DataVersion.objects.create(name='epoch', stamp=time.time())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_feed_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Набор данных')),
+                ('stamp', models.FloatField(verbose_name='Метка изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия данных',
+                'verbose_name_plural': 'Версии данных',
+            },
+        ),
+        migrations.RunPython(add_epoch, migrations.RunPython.noop),
+    ]
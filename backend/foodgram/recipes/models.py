@@ -1,9 +1,22 @@
+from itertools import chain
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import (
+    Exists, F, OuterRef, Q, Subquery, Sum, Window
+)
+from django.db.models.functions import RowNumber
+
+from users.models import Subscription, UniquePairQuerySet
 
 User = get_user_model()
 
+# Строк списка покупок в одном INSERT ... ON CONFLICT.
+UPSERT_BATCH_SIZE = 300
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -47,16 +60,108 @@ class Ingredient(models.Model):
         max_length=200,
         verbose_name='Единицы измерения',
     )
+    # Характеристики на единицу измерения; пусто - неизвестно.
+    calories = models.FloatField(
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        verbose_name='Калорийность, ккал',
+    )
+    proteins = models.FloatField(
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        verbose_name='Белки, г',
+    )
+    fats = models.FloatField(
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        verbose_name='Жиры, г',
+    )
+    carbohydrates = models.FloatField(
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        verbose_name='Углеводы, г',
+    )
+    price = models.FloatField(
+        null=True,
+        blank=True,
+        validators=(MinValueValidator(0),),
+        verbose_name='Цена, руб.',
+    )
 
     class Meta:
         verbose_name = 'Ингредиент',
         verbose_name_plural = 'Ингредиенты'
         ordering = ('id',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+def recipe_prefetches():
+    return (
+        'tags',
+        models.Prefetch(
+            'recipe_with',
+            queryset=IngredientInRecipe.objects.select_related('ingredient'),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты пачкой на всю выборку."""
+        return self.select_related('author').prefetch_related(
+            *recipe_prefetches()
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного, корзины и подписки на автора."""
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'),
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'),
+            )),
+            is_author_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author'),
+            )),
+        )
+
+    def feed(self, user):
+        """Лента подписок, свежие рецепты первыми.
+
+        Обычно страница читается по индексу FeedItem (user, -pub_date,
+        -recipe) с присоединением рецептов. Если пользователь подписан на
+        крупных авторов, их рецепты не раскладываются по лентам и
+        добавляются подзапросом."""
+        large_authors = Subscription.objects.filter(
+            user=user,
+            author__subscribers_count__gte=settings.FEED_FANOUT_LIMIT,
+        ).values('author_id')
+        if not large_authors.exists():
+            return self.filter(in_feeds__user=user).order_by(
+                '-in_feeds__pub_date', '-in_feeds__recipe_id',
+            )
+        return self.filter(
+            Q(pk__in=FeedItem.objects.filter(user=user).values('recipe_id'))
+            | Q(author_id__in=large_authors)
+        ).order_by('-pub_date', '-pk')
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -74,6 +179,13 @@ class Recipe(models.Model):
         null=True,
         default=None,
     )
+    thumbnail = models.ImageField(
+        verbose_name='Миниатюра',
+        upload_to='photo/thumbnails/',
+        null=True,
+        blank=True,
+        default=None,
+    )
     text = models.TextField(
         verbose_name='Текстовое описание',
     )
@@ -99,16 +211,154 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата изменения',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт',
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class SimilarRecipe(models.Model):
+    """Похожий рецепт с косинусной близостью по ингредиентам и тегам.
+    Заполняется командой compute_similar_recipes."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Близость',
+    )
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчёта',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class RecipeSearchEntry(models.Model):
+    """Строка полнотекстового индекса рецептов на SQLite: таблица FTS5
+    из миграции 0008, см. recipes.search. Модель нужна только для JOIN
+    с рецептами; на PostgreSQL таблицы нет, там Recipe.search_vector."""
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name='search_entry',
+        verbose_name='Рецепт',
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+        verbose_name = 'Поисковая запись рецепта'
+        verbose_name_plural = 'Поисковые записи рецептов'
+
+
+class DataVersion(models.Model):
+    """Метка последнего изменения набора данных (справочника, рецепта,
+    выбора пользователя) для ETag, ключей кэша и индексов в памяти.
+    Хранится в БД, чтобы её видели все воркеры и команды."""
+    name = models.CharField(
+        max_length=64,
+        primary_key=True,
+        verbose_name='Набор данных',
+    )
+    stamp = models.FloatField(
+        verbose_name='Метка изменения',
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.stamp}'
+
+
+class PantryChange(models.Model):
+    """Журнал рецептов с изменёнными ингредиентами для индекса
+    recipes.pantry: воркеры догоняют его по номеру записи. Рецепт не
+    внешний ключ - удалённые рецепты тоже попадают в журнал."""
+    id = models.BigAutoField(primary_key=True)
+    recipe_id = models.IntegerField(
+        verbose_name='Рецепт',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Время изменения',
+    )
+
+    class Meta:
+        verbose_name = 'Изменение ингредиентов рецепта'
+        verbose_name_plural = 'Изменения ингредиентов рецептов'
+
+    def __str__(self):
+        return f'{self.pk}: {self.recipe_id}'
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -123,9 +373,17 @@ class Favorite(models.Model):
         verbose_name='Избранный рецепт',
     )
 
+    objects = UniquePairQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite',
+            ),
+        )
 
     def __str__(self):
         return f'Рецепт {self.recipe} в избранном у {self.user}'
@@ -145,9 +403,17 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = UniquePairQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart',
+            ),
+        )
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок у {self.user}'
@@ -179,6 +445,274 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте',
         verbose_name_plural = 'Ингредиенты в рецептах'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_ingredient_in_recipe',
+            ),
+        )
 
     def __str__(self):
         return f'{self.ingredient} добавлен в рецепт {self.recipe}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+
+    def apply_deltas(self, user_ids, deltas):
+        """Прибавляет к спискам покупок пользователей приращения
+        количества ингредиентов {ingredient_id: delta}.
+
+        Строки добавляются и меняются одним INSERT ... ON CONFLICT DO
+        UPDATE, так что параллельные изменения одного списка не
+        сталкиваются на уникальном ограничении."""
+        user_ids = sorted(set(user_ids))
+        deltas = {
+            ingredient: delta
+            for ingredient, delta in sorted(deltas.items()) if delta
+        }
+        if not user_ids or not deltas:
+            return
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        user, ingredient, amount = (
+            quote(self.model._meta.get_field(name).column)
+            for name in ('user', 'ingredient', 'total_amount')
+        )
+        rows = [
+            (user_id, ingredient_id, delta)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items()
+        ]
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                batch = rows[start:start + UPSERT_BATCH_SIZE]
+                cursor.execute(
+                    f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                    f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                    list(chain.from_iterable(batch)),
+                )
+        self.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas,
+            total_amount__lte=0,
+        ).delete()
+
+    def add_recipe(self, user_ids, recipe, sign=1):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта."""
+        self.add_recipes(user_ids, [recipe], sign)
+
+    def add_recipes(self, user_ids, recipes, sign=1):
+        """То же для нескольких рецептов сразу."""
+        self.apply_deltas(user_ids, {
+            ingredient: sign * amount
+            for ingredient, amount in recipe_amounts(*recipes).items()
+        })
+
+    def rebuild(self, user_ids):
+        """Пересчитывает списки покупок пользователей с нуля."""
+        self.filter(user_id__in=user_ids).delete()
+        totals = IngredientInRecipe.objects.filter(
+            recipe__in_shopping_list__user_id__in=user_ids,
+        ).values(
+            'recipe__in_shopping_list__user_id', 'ingredient_id',
+        ).annotate(total=Sum('amount')).order_by()
+        self.bulk_create(
+            self.model(
+                user_id=row['recipe__in_shopping_list__user_id'],
+                ingredient_id=row['ingredient_id'],
+                total_amount=row['total'],
+            )
+            for row in totals
+        )
+
+
+def recipe_amounts(*recipes):
+    """Количество каждого ингредиента в рецептах."""
+    return dict(
+        IngredientInRecipe.objects.filter(recipe__in=recipes).values(
+            'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by().values_list(
+            'ingredient_id', 'total'
+        )
+    )
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя.
+    Обновляется при изменении корзины и рецептов в ней."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='in_shopping_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.IntegerField(
+        verbose_name='Общее количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Продукт в списке покупок'
+        verbose_name_plural = 'Продукты в списках покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-total_amount'),
+                name='shopping_item_user_amount_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.total_amount} у {self.user}'
+
+
+class FeedItemQuerySet(models.QuerySet):
+    """Раскладка рецептов по лентам подписчиков при записи.
+
+    Подписчики крупного автора (FEED_FANOUT_LIMIT и больше) получают его
+    рецепты при чтении ленты, иначе один рецепт стоил бы столько же
+    вставок, сколько у автора подписчиков."""
+
+    def execute(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def tables(self):
+        quote = connections[self.db].ops.quote_name
+        return (
+            quote(self.model._meta.db_table),
+            quote(Subscription._meta.db_table),
+            quote(Recipe._meta.db_table),
+            quote(User._meta.db_table),
+        )
+
+    def fan_out(self, recipe_ids):
+        """Добавляет новые рецепты в ленты подписчиков их авторов одним
+        запросом и обрезает эти ленты. Ленты подписчиков крупных авторов
+        не менялись, их не трогаем."""
+        if not recipe_ids:
+            return
+        feed, subscription, recipe, user = self.tables()
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        self.execute(
+            f'INSERT INTO {feed} (user_id, recipe_id, pub_date) '
+            f'SELECT s.user_id, r.id, r.pub_date FROM {recipe} r '
+            f'JOIN {subscription} s ON s.author_id = r.author_id '
+            f'JOIN {user} u ON u.id = r.author_id '
+            f'WHERE r.id IN ({placeholders}) AND u.subscribers_count < %s '
+            f'ON CONFLICT DO NOTHING',
+            [*recipe_ids, settings.FEED_FANOUT_LIMIT],
+        )
+        self.trim(Subscription.objects.filter(
+            author__recipes__in=recipe_ids,
+            author__subscribers_count__lt=settings.FEED_FANOUT_LIMIT,
+        ).values('user_id'))
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту нового подписчика последние рецепты автора."""
+        feed, _, recipe, user = self.tables()
+        self.execute(
+            f'INSERT INTO {feed} (user_id, recipe_id, pub_date) '
+            f'SELECT %s, r.id, r.pub_date FROM {recipe} r '
+            f'JOIN {user} u ON u.id = r.author_id '
+            f'WHERE r.author_id = %s AND u.subscribers_count < %s '
+            f'ORDER BY r.pub_date DESC, r.id DESC LIMIT %s '
+            f'ON CONFLICT DO NOTHING',
+            [user_id, author_id, settings.FEED_FANOUT_LIMIT,
+             settings.FEED_BACKFILL],
+        )
+        self.trim([user_id])
+
+    def drop(self, user_id, author_id):
+        """Убирает рецепты автора из ленты отписавшегося пользователя."""
+        self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+    def trim(self, user_ids):
+        """Оставляет в лентах пользователей по FEED_LENGTH свежих рецептов."""
+        self.filter(pk__in=Subquery(
+            self.filter(user_id__in=user_ids).annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F('user_id'),
+                    order_by=(F('pub_date').desc(), F('recipe_id').desc()),
+                ),
+            ).filter(position__gt=settings.FEED_LENGTH).values('pk')
+        )).delete()
+
+    def rebuild(self, user_ids):
+        """Пересобирает ленты пользователей с нуля."""
+        self.filter(user_id__in=user_ids).delete()
+        recipes = Recipe.objects.filter(
+            author__author__user_id__in=user_ids,
+            author__subscribers_count__lt=settings.FEED_FANOUT_LIMIT,
+        ).annotate(
+            follower_id=F('author__author__user_id'),
+            position=Window(
+                RowNumber(),
+                partition_by=F('author__author__user_id'),
+                order_by=(F('pub_date').desc(), F('pk').desc()),
+            ),
+        ).filter(position__lte=settings.FEED_LENGTH)
+        self.bulk_create(
+            self.model(
+                user_id=follower_id, recipe_id=recipe_id, pub_date=pub_date,
+            )
+            for follower_id, recipe_id, pub_date in recipes.values_list(
+                'follower_id', 'pk', 'pub_date',
+            )
+        )
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя. Дата публикации рецепта
+    скопирована сюда, чтобы лента читалась и обрезалась по индексу."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='in_feeds',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    objects = FeedItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_item_user_pub_date_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
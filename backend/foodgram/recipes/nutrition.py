@@ -0,0 +1,97 @@
+"""Пищевая ценность и стоимость рецептов.
+
+Характеристики ингредиентов (на единицу измерения) лежат в плотной
+матрице «ингредиент x характеристика», строка - id ингредиента.
+Итоги рецептов - разреженная матрица количеств «рецепт x ингредиент»,
+умноженная на неё, так что корзина считается одним проходом."""
+from collections import namedtuple
+
+import numpy as np
+from scipy import sparse
+
+from .models import Ingredient, IngredientInRecipe
+from .snapshots import VersionedSnapshot
+from .versions import INGREDIENTS
+
+NUTRIENTS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+
+Snapshot = namedtuple('Snapshot', ('version', 'values', 'known'))
+
+
+class NutritionMatrix(VersionedSnapshot):
+    """Матрица характеристик ингредиентов в памяти процесса.
+    Перестраивается, когда меняется версия каталога ингредиентов."""
+    version_name = INGREDIENTS
+
+    def build(self, version):
+        rows = list(Ingredient.objects.exclude(
+            **{nutrient: None for nutrient in NUTRIENTS}
+        ).values_list('pk', *NUTRIENTS))
+        size = max((row[0] for row in rows), default=-1) + 1
+        values = np.full((size, len(NUTRIENTS)), np.nan)
+        if rows:
+            data = np.array(rows, dtype=float)
+            values[data[:, 0].astype(np.int64)] = data[:, 1:]
+        known = ~np.isnan(values)
+        return Snapshot(version, np.nan_to_num(values), known)
+
+    def aggregate(self, rows):
+        """Суммы по рецептам из строк (recipe_id, ingredient_id, amount):
+        id рецептов, суммы характеристик, число ингредиентов с каждой
+        характеристикой и число ингредиентов."""
+        snapshot = self.snapshot()
+        rows = np.array(list(rows), dtype=np.int64).reshape(-1, 3)
+        recipe_ids, positions = np.unique(rows[:, 0], return_inverse=True)
+        positions = positions.reshape(-1)
+        # Ингредиенты новее матрицы попадают в пустую последнюю строку.
+        ingredient_ids = np.minimum(rows[:, 1], len(snapshot.values))
+        shape = (len(recipe_ids), len(snapshot.values) + 1)
+        amounts = sparse.csr_matrix(
+            (rows[:, 2].astype(float), (positions, ingredient_ids)),
+            shape=shape,
+        )
+        present = sparse.csr_matrix(
+            (np.ones(len(rows)), (positions, ingredient_ids)), shape=shape,
+        )
+        padding = np.zeros((1, len(NUTRIENTS)))
+        return (
+            recipe_ids,
+            amounts @ np.vstack((snapshot.values, padding)),
+            present @ np.vstack((snapshot.known, padding)),
+            np.asarray(present.sum(axis=1)).ravel(),
+        )
+
+    def recipe_totals(self, recipe_ids, rows=None):
+        """Итоги рецептов {recipe_id: итоги} и их сумма.
+
+        Строки (recipe_id, ingredient_id, amount) без rows читаются из
+        БД одним запросом."""
+        if rows is None:
+            rows = IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids,
+            ).values_list('recipe_id', 'ingredient_id', 'amount')
+        found, sums, counts, sizes = self.aggregate(rows)
+        totals = {
+            int(recipe_id): totals_dict(*row)
+            for recipe_id, *row in zip(found, sums, counts, sizes)
+        }
+        empty = totals_dict(*np.zeros((2, len(NUTRIENTS))), 0)
+        return (
+            {recipe_id: totals.get(recipe_id, empty)
+             for recipe_id in recipe_ids},
+            totals_dict(sums.sum(axis=0), counts.sum(axis=0), sizes.sum()),
+        )
+
+
+def totals_dict(sums, counts, size):
+    """Характеристика, которой нет ни у одного ингредиента, - None;
+    complete - известны все характеристики всех ингредиентов."""
+    data = {
+        nutrient: round(float(value), 1) if count else None
+        for nutrient, value, count in zip(NUTRIENTS, sums, counts)
+    }
+    data['complete'] = bool((counts == size).all())
+    return data
+
+
+nutrition_matrix = NutritionMatrix()
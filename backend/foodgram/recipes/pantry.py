@@ -0,0 +1,215 @@
+import time
+from array import array
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from itertools import chain, groupby
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import IngredientInRecipe, PantryChange
+from .snapshots import ProcessIndex
+
+# Записи параллельных транзакций коммитятся не по порядку номеров,
+# поэтому столько последних записей журнала перечитывается повторно.
+SETTLE_CHANGES = 100
+# Индекс перестраивается целиком не реже этого, даже если журнал цел.
+REBUILD_INTERVAL = 60 * 60
+# Сколько хранится запись журнала; должно быть больше REBUILD_INTERVAL.
+CHANGE_TIMEOUT = 24 * 60 * 60
+# Устаревшие записи удаляются примерно раз на столько новых.
+PRUNE_EVERY = 1000
+
+Match = namedtuple('Match', ('recipe_id', 'matched', 'total'))
+
+
+def log_changes(recipe_ids):
+    changes = PantryChange.objects.bulk_create([
+        PantryChange(recipe_id=recipe_id) for recipe_id in sorted(recipe_ids)
+    ])
+    last = changes[-1].pk
+    if last is not None and last % PRUNE_EVERY < len(changes):
+        PantryChange.objects.filter(
+            created__lt=timezone.now() - timedelta(seconds=CHANGE_TIMEOUT),
+        ).delete()
+
+
+def flush_pending_changes():
+    recipe_ids = getattr(connection, 'pantry_pending', None)
+    if recipe_ids:
+        connection.pantry_pending = set()
+        log_changes(recipe_ids)
+
+
+def recipe_ingredients_changed(recipe_ids):
+    """Отмечает рецепты, у которых поменялись ингредиенты.
+
+    Изменения за транзакцию уходят в журнал одним запросом после
+    коммита. После отката id остаются в очереди и уйдут со следующими:
+    индекс лишь перечитает эти рецепты из БД."""
+    pending = getattr(connection, 'pantry_pending', None)
+    if pending is None:
+        pending = connection.pantry_pending = set()
+    pending.update(recipe_ids)
+    transaction.on_commit(flush_pending_changes)
+
+
+class PantryIndex(ProcessIndex):
+    """Инвертированный индекс «ингредиент -> рецепты» в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    для каждого рецепта - массив его ингредиентов (по нему изменения
+    затрагивают только нужные массивы) и их число. Процесс читает новые
+    записи журнала PantryChange и перечитывает из БД только изменённые
+    рецепты; при большом отставании и раз в REBUILD_INTERVAL индекс
+    строится заново."""
+    max_changes = 1000
+
+    def __init__(self):
+        super().__init__()
+        self._sequence = None
+        # Применённые записи из последних SETTLE_CHANGES.
+        self._applied = set()
+        self._built_at = 0.0
+        self._postings = {}
+        self._ingredients = {}
+        self._sizes = array('H')
+
+    def build(self):
+        postings = {}
+        ingredients = defaultdict(lambda: array('i'))
+        sizes = array('H')
+        rows = IngredientInRecipe.objects.order_by(
+            'ingredient_id', 'recipe_id',
+        ).values_list('ingredient_id', 'recipe_id').iterator(
+            chunk_size=10_000
+        )
+        for ingredient_id, group in groupby(rows, key=itemgetter(0)):
+            recipes = array('i', map(itemgetter(1), group))
+            postings[ingredient_id] = recipes
+            if recipes[-1] >= len(sizes):
+                sizes.extend(bytes(recipes[-1] + 1 - len(sizes)))
+            for recipe_id in recipes:
+                sizes[recipe_id] += 1
+                ingredients[recipe_id].append(ingredient_id)
+        self._postings, self._ingredients, self._sizes = (
+            postings, dict(ingredients), sizes,
+        )
+
+    def apply(self, recipe_ids):
+        """Перечитывает ингредиенты рецептов и пересобирает массивы только
+        тех ингредиентов, что у рецептов появились или пропали. Массивы
+        заменяются целиком, так что параллельный поиск видит либо старый,
+        либо новый."""
+        current = {recipe_id: set() for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids,
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].add(ingredient_id)
+        added = defaultdict(list)
+        removed = defaultdict(set)
+        for recipe_id, ingredients in current.items():
+            old = set(self._ingredients.get(recipe_id, ()))
+            for ingredient_id in ingredients - old:
+                added[ingredient_id].append(recipe_id)
+            for ingredient_id in old - ingredients:
+                removed[ingredient_id].add(recipe_id)
+        postings = self._postings
+        for ingredient_id in added.keys() | removed.keys():
+            dropped = removed.get(ingredient_id, ())
+            recipes = array('i', sorted(chain(
+                (recipe_id for recipe_id in postings.get(ingredient_id, ())
+                 if recipe_id not in dropped),
+                added.get(ingredient_id, ()),
+            )))
+            if recipes:
+                postings[ingredient_id] = recipes
+            else:
+                postings.pop(ingredient_id, None)
+        for recipe_id, ingredients in current.items():
+            if ingredients:
+                self._ingredients[recipe_id] = array('i', sorted(ingredients))
+            else:
+                self._ingredients.pop(recipe_id, None)
+            if recipe_id >= len(self._sizes):
+                self._sizes.extend(bytes(recipe_id + 1 - len(self._sizes)))
+            self._sizes[recipe_id] = len(ingredients)
+
+    def rebuild(self):
+        # Номер берётся до чтения данных: записи, закоммиченные во
+        # время сборки, будут применены ещё раз при следующей сверке.
+        sequence = PantryChange.objects.aggregate(
+            sequence=Max('pk'),
+        )['sequence'] or 0
+        self.build()
+        self._sequence, self._applied = sequence, set()
+        self._built_at = time.monotonic()
+
+    def changes(self, sequence):
+        """Записи журнала после sequence вместе с SETTLE_CHANGES
+        предыдущими, не больше, чем имеет смысл применять по одной."""
+        return list(PantryChange.objects.filter(
+            pk__gt=sequence - SETTLE_CHANGES,
+        ).order_by('pk').values_list('pk', 'recipe_id')[
+            :SETTLE_CHANGES + self.max_changes + 1
+        ])
+
+    def stale(self):
+        return (self._sequence is None
+                or time.monotonic() - self._built_at > REBUILD_INTERVAL)
+
+    def refresh(self):
+        if self.stale():
+            with self._lock:
+                if self.stale():
+                    self.rebuild()
+            return
+        rows = self.changes(self._sequence)
+        with self._lock:
+            new = [row for row in rows if row[0] not in self._applied]
+            if not new:
+                return
+            if len(rows) > SETTLE_CHANGES + self.max_changes:
+                self.rebuild()
+                return
+            self.apply({recipe_id for _, recipe_id in new})
+            self._sequence = max(self._sequence, rows[-1][0])
+            self._applied = {
+                pk for pk in chain(self._applied, (pk for pk, _ in new))
+                if pk > self._sequence - SETTLE_CHANGES
+            }
+
+    def match(self, ingredient_ids, exclude_ids=()):
+        """Рецепты, где есть хоть один из ингредиентов, без рецептов с
+        исключёнными. Сначала те, что покрыты полнее, затем с меньшим
+        числом недостающих ингредиентов, затем новые."""
+        self.refresh()
+        postings, sizes = self._postings, self._sizes
+        matched = Counter(chain.from_iterable(
+            postings.get(ingredient_id, ())
+            for ingredient_id in set(ingredient_ids)
+        ))
+        excluded = set(chain.from_iterable(
+            postings.get(ingredient_id, ()) for ingredient_id in exclude_ids
+        ))
+        # Кортежи сравниваются без Python-функции ключа: доля покрытия,
+        # затем недостающие ингредиенты, затем новые рецепты.
+        ranked = []
+        for recipe_id, count in matched.items():
+            # Пока другой поток применяет изменения, размер может
+            # отставать от массивов: такие рецепты пропускаются.
+            total = sizes[recipe_id] if recipe_id < len(sizes) else 0
+            if total >= count and recipe_id not in excluded:
+                ranked.append(
+                    (-count / total, total - count, -recipe_id, count, total)
+                )
+        ranked.sort()
+        return [
+            Match(-recipe_id, count, total)
+            for _, _, recipe_id, count, total in ranked
+        ]
+
+
+pantry_index = PantryIndex()
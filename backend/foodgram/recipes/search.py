@@ -0,0 +1,217 @@
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict, namedtuple
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector
+)
+from django.db import connection
+from django.db.models import (
+    BooleanField, F, FloatField, OuterRef, Q, Subquery, TextField, Value
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import (
+    Ingredient, IngredientInRecipe, Recipe, RecipeSearchEntry
+)
+from .snapshots import VersionedSnapshot
+from .versions import INGREDIENTS
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = RecipeSearchEntry._meta.db_table
+
+Snapshot = namedtuple(
+    'Snapshot', ('version', 'ingredients', 'keys', 'sorted_keys',
+                 'sorted_positions', 'trigrams', 'trigram_counts'),
+)
+
+
+def normalize(name):
+    return name.strip().casefold().replace('ё', 'е')
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class IngredientIndex(VersionedSnapshot):
+    """Индекс названий ингредиентов в памяти процесса.
+
+    Сначала отдаёт совпадения по началу названия, затем по подстроке,
+    затем похожие по триграммам (опечатки). Перестраивается, когда
+    меняется версия каталога ингредиентов."""
+    version_name = INGREDIENTS
+    fuzzy_limit = 10
+    fuzzy_threshold = 0.3
+
+    def build(self, version):
+        ingredients = list(Ingredient.objects.order_by('id'))
+        keys = [normalize(ingredient.name) for ingredient in ingredients]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        index = defaultdict(list)
+        counts = []
+        for position, key in enumerate(keys):
+            grams = trigrams(f' {key} ')
+            counts.append(len(grams))
+            for gram in grams:
+                index[gram].append(position)
+        return Snapshot(
+            version, ingredients, keys,
+            [keys[position] for position in order], order,
+            dict(index), counts,
+        )
+
+    def search(self, query):
+        snapshot = self.snapshot()
+        query = normalize(query)
+        if not query:
+            return snapshot.ingredients
+
+        start = bisect_left(snapshot.sorted_keys, query)
+        end = bisect_left(snapshot.sorted_keys, query + '\uffff', start)
+        found = snapshot.sorted_positions[start:end]
+        seen = set(found)
+
+        if len(query) < 3:
+            candidates = range(len(snapshot.keys))
+        else:
+            postings = sorted(
+                (snapshot.trigrams.get(gram, ()) for gram in trigrams(query)),
+                key=len,
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        found += sorted(
+            (position for position in candidates
+             if position not in seen and query in snapshot.keys[position]),
+            key=snapshot.keys.__getitem__,
+        )
+        if len(found) >= self.fuzzy_limit:
+            return [snapshot.ingredients[position] for position in found]
+        seen.update(found)
+
+        query_grams = trigrams(f' {query} ')
+        shared = Counter(
+            position
+            for gram in query_grams
+            for position in snapshot.trigrams.get(gram, ())
+            if position not in seen
+        )
+        similar = []
+        for position, common in shared.items():
+            similarity = common / (
+                len(query_grams) + snapshot.trigram_counts[position] - common
+            )
+            if similarity >= self.fuzzy_threshold:
+                similar.append((-similarity, snapshot.keys[position],
+                                position))
+        similar.sort()
+        found += [
+            position
+            for *_, position in similar[:self.fuzzy_limit - len(found)]
+        ]
+
+        return [snapshot.ingredients[position] for position in found]
+
+
+ingredient_index = IngredientIndex()
+
+
+def update_search_index(recipe_ids=None):
+    """Пересчитывает поисковый индекс рецептов (всех, если id не заданы).
+
+    На PostgreSQL это столбец search_vector с GIN-индексом, на SQLite -
+    отдельная таблица FTS5."""
+    if connection.vendor == 'postgresql':
+        update_search_vectors(recipe_ids)
+    elif connection.vendor == 'sqlite':
+        update_fts_table(recipe_ids)
+
+
+def update_search_vectors(recipe_ids):
+    ingredient_names = Subquery(
+        IngredientInRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    recipes.update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(
+                ingredient_names, Value(''), output_field=TextField(),
+            ),
+            weight='B', config=SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    ))
+
+
+def update_fts_table(recipe_ids):
+    if recipe_ids is None:
+        delete_where = insert_where = ''
+        params = []
+    else:
+        params = list(recipe_ids)
+        if not params:
+            return
+        placeholders = ', '.join(['%s'] * len(params))
+        delete_where = f' WHERE rowid IN ({placeholders})'
+        insert_where = f' WHERE r.id IN ({placeholders})'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}' + delete_where, params)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+            "SELECT r.id, r.name, r.text, COALESCE(("
+            " SELECT group_concat(i.name, ' ')"
+            " FROM recipes_ingredientinrecipe ir"
+            " JOIN recipes_ingredient i ON i.id = ir.ingredient_id"
+            " WHERE ir.recipe_id = r.id"
+            "), '') FROM recipes_recipe r" + insert_where,
+            params,
+        )
+
+
+def search_recipes(queryset, query):
+    """Отбирает рецепты по запросу и сортирует по релевантности:
+    совпадения в названии важнее ингредиентов, ингредиенты - текста."""
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch',
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-rank', '-pub_date')
+
+    words = re.findall(r'\w+', query)
+    if connection.vendor == 'sqlite':
+        if not words:
+            return queryset.none()
+        match = ' '.join(f'"{word}"*' for word in words)
+        # bm25() работает только в запросе, где таблица FTS5 стоит во
+        # FROM с MATCH, поэтому она присоединяется к рецептам через
+        # RecipeSearchEntry.
+        matched = RawSQL(
+            f'{FTS_TABLE} MATCH %s', (match,), output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f'-bm25({FTS_TABLE}, 10.0, 1.0, 5.0)', (),
+            output_field=FloatField(),
+        )
+        return queryset.filter(
+            matched, search_entry__isnull=False,
+        ).annotate(rank=rank).order_by('-rank', '-pub_date')
+
+    condition = Q()
+    for word in words:
+        condition &= (
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Q(ingredients__name__icontains=word)
+        )
+    return queryset.filter(condition).distinct()
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Subscription
+from .models import (
+    Favorite, FeedItem, Ingredient, IngredientInRecipe, Recipe,
+    ShoppingCart, Tag
+)
+from .pantry import recipe_ingredients_changed
+from .search import update_search_index
+from .versions import (
+    INGREDIENTS, TAGS, bump_version, recipe_version, user_version
+)
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    bump_version(INGREDIENTS)
+    if kwargs['signal'] is post_save and not created:
+        update_search_index(
+            instance.in_recipe.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version(TAGS)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_version(recipe_version(instance.pk))
+    # save() перезаписывает search_vector, поэтому индекс пересчитывается.
+    update_search_index([instance.pk])
+    if kwargs['signal'] is post_delete:
+        recipe_ingredients_changed([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        FeedItem.objects.fan_out([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_version(recipe_version(instance.recipe_id))
+    recipe_ingredients_changed([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_version(recipe_version(instance.pk))
+    elif pk_set:
+        bump_version(*(recipe_version(pk) for pk in pk_set))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscription)
+def user_choice_changed(sender, instance, **kwargs):
+    bump_version(user_version(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    recipes = instance.recipes.values_list('pk', flat=True)
+    bump_version(
+        user_version(instance.pk),
+        *(recipe_version(pk) for pk in recipes),
+    )
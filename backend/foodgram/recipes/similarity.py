@@ -0,0 +1,276 @@
+"""Похожие рецепты по ингредиентам и тегам.
+
+Рецепт - разреженный вектор из двух частей: ингредиенты с весом IDF
+(соль есть почти везде и мало что говорит о рецепте) и теги. Каждая
+часть нормируется отдельно и умножается на корень своего веса, так что
+скалярное произведение строк - это
+INGREDIENT_WEIGHT * cos(ингредиенты) + TAG_WEIGHT * cos(теги).
+Для каждого рецепта в SimilarRecipe хранятся top_k ближайших.
+
+При частичном пересчёте IDF берётся по текущим рецептам, а списки
+нетронутых рецептов остаются со старыми весами; полный пересчёт
+выравнивает расхождение."""
+from itertools import chain
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from scipy import sparse
+
+from .models import IngredientInRecipe, Recipe, SimilarRecipe
+
+TOP_K = 10
+INGREDIENT_WEIGHT = 0.7
+TAG_WEIGHT = 0.3
+# Сколько близостей (float32) считается одним плотным блоком.
+BLOCK_SIZE = 1 << 23
+QUERY_CHUNK_SIZE = 10_000
+INSERT_BATCH_SIZE = 1000
+
+
+def read_pairs(queryset):
+    """Пары (id, id) из values_list одним массивом n x 2."""
+    return np.fromiter(
+        chain.from_iterable(queryset.iterator(chunk_size=QUERY_CHUNK_SIZE)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+def positions_of(ids, values):
+    """Позиции values в отсортированном ids и маска найденных."""
+    values = np.asarray(values, dtype=np.int64)
+    positions = np.searchsorted(ids, values)
+    found = positions < len(ids)
+    found[found] = ids[positions[found]] == values[found]
+    return positions, found
+
+
+def weighted_block(ids, pairs, weight):
+    """Нормированная по строкам матрица рецепты x признаки с IDF."""
+    # Связи рецептов, созданных после чтения списка рецептов, не нужны.
+    positions, found = positions_of(ids, pairs[:, 0])
+    positions, pairs = positions[found], pairs[found]
+    _, columns = np.unique(pairs[:, 1], return_inverse=True)
+    columns = columns.reshape(-1)
+    frequency = np.bincount(columns)
+    idf = np.log((1 + len(ids)) / (1 + frequency)) + 1
+    block = sparse.csr_matrix(
+        (idf[columns].astype(np.float32), (positions, columns)),
+        shape=(len(ids), len(frequency)),
+    )
+    block.sum_duplicates()
+    norms = np.sqrt(np.asarray(block.multiply(block).sum(axis=1)).ravel())
+    scale = np.divide(
+        np.sqrt(weight), norms, out=np.zeros_like(norms), where=norms > 0,
+    )
+    return sparse.diags(scale.astype(np.float32)) @ block
+
+
+def feature_matrix():
+    """Отсортированные id рецептов и матрица их признаков (CSR)."""
+    ids = np.fromiter(
+        Recipe.objects.order_by('pk').values_list('pk', flat=True).iterator(
+            chunk_size=QUERY_CHUNK_SIZE
+        ),
+        dtype=np.int64,
+    )
+    ingredients = read_pairs(
+        IngredientInRecipe.objects.values_list('recipe_id', 'ingredient_id')
+    )
+    tags = read_pairs(
+        Recipe.tags.through.objects.values_list('recipe_id', 'tag_id')
+    )
+    return ids, sparse.hstack((
+        weighted_block(ids, ingredients, INGREDIENT_WEIGHT),
+        weighted_block(ids, tags, TAG_WEIGHT),
+    ), format='csr', dtype=np.float32)
+
+
+def block_scores(features, rows):
+    """Плотный блок близостей строк rows со всеми рецептами."""
+    return np.ascontiguousarray(
+        (features @ features[rows].T.toarray()).T, dtype=np.float32
+    )
+
+
+def row_blocks(rows, total):
+    step = max(1, BLOCK_SIZE // max(total, 1))
+    for start in range(0, len(rows), step):
+        yield rows[start:start + step]
+
+
+def nearest(features, rows, top_k):
+    """top_k соседей строк rows: позиции и близости, лучшие первыми.
+
+    Нулевая близость (ничего общего) соседом не считается."""
+    scores = block_scores(features, rows)
+    scores[np.arange(len(rows)), rows] = 0
+    top_k = min(top_k, scores.shape[1])
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return (
+        np.take_along_axis(top, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
+
+
+def insert_rows(rows):
+    """Пишет строки (recipe_id, similar_id, score, computed_at) мимо ORM:
+    на миллионах соседей bulk_create тратит на модели больше времени,
+    чем БД на вставку."""
+    if not rows:
+        return
+    table = SimilarRecipe._meta.db_table
+    fields = [
+        SimilarRecipe._meta.get_field(name)
+        for name in ('recipe', 'similar', 'score', 'computed_at')
+    ]
+    batch_size = min(
+        INSERT_BATCH_SIZE, connection.ops.bulk_batch_size(fields, rows),
+    )
+    columns = ', '.join(field.column for field in fields)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES '
+                + ', '.join(['(%s, %s, %s, %s)'] * len(batch)),
+                list(chain.from_iterable(batch)),
+            )
+
+
+def store(neighbors, computed_at):
+    """Заменяет соседей рецептов: {recipe_id: [(similar_id, score)]}."""
+    if not neighbors:
+        return
+    mentioned = set(neighbors).union(*(
+        (similar_id for similar_id, _ in pairs)
+        for pairs in neighbors.values()
+    ))
+    with transaction.atomic():
+        # Рецепт мог быть удалён, пока шёл расчёт.
+        existing = set(Recipe.objects.filter(
+            pk__in=mentioned
+        ).values_list('pk', flat=True))
+        SimilarRecipe.objects.filter(recipe_id__in=list(neighbors)).delete()
+        computed_at = connection.ops.adapt_datetimefield_value(computed_at)
+        insert_rows([
+            (recipe_id, similar_id, score, computed_at)
+            for recipe_id, pairs in neighbors.items()
+            if recipe_id in existing
+            for similar_id, score in pairs
+            if similar_id in existing
+        ])
+
+
+def recompute(features, ids, rows, top_k, computed_at):
+    """Полный пересчёт соседей для строк rows, блоками."""
+    for block in row_blocks(rows, len(ids)):
+        top, top_scores = nearest(features, block, top_k)
+        store({
+            int(ids[row]): [
+                (int(ids[column]), float(score))
+                for column, score in zip(columns, scores) if score > 0
+            ]
+            for row, columns, scores in zip(block, top, top_scores)
+        }, computed_at)
+
+
+def last_run():
+    return SimilarRecipe.objects.aggregate(
+        last=Max('computed_at')
+    )['last']
+
+
+def in_chunks(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def affected_recipes(changed_ids, top_k):
+    """Рецепты, чей список соседей нельзя просто дополнить: в нём есть
+    изменённый рецепт или в нём меньше top_k соседей (кто-то удалён)."""
+    affected = set()
+    for chunk in in_chunks(changed_ids):
+        affected.update(SimilarRecipe.objects.filter(
+            similar_id__in=chunk
+        ).values_list('recipe_id', flat=True))
+    affected.update(Recipe.objects.annotate(
+        neighbors=Count('similar')
+    ).filter(neighbors__lt=top_k).values_list('pk', flat=True))
+    return affected
+
+
+def merge_changed(features, ids, changed_rows, skip_rows, top_k,
+                  computed_at):
+    """Добавляет изменённые рецепты в списки остальных рецептов.
+
+    Список рецепта меняется, только если изменённый рецепт ближе его
+    самого дальнего соседа. Возвращает число обновлённых рецептов."""
+    lowest = list(SimilarRecipe.objects.values('recipe_id').annotate(
+        lowest=Min('score'),
+    ).values_list('recipe_id', 'lowest').order_by())
+    recipe_ids = np.fromiter(
+        (recipe_id for recipe_id, _ in lowest), dtype=np.int64,
+    )
+    positions, found = positions_of(ids, recipe_ids)
+    thresholds = np.full(len(ids), np.inf, dtype=np.float32)
+    thresholds[positions[found]] = np.fromiter(
+        (score for _, score in lowest), dtype=np.float32,
+    )[found]
+    thresholds[skip_rows] = np.inf
+    candidates = {}
+    for block in row_blocks(changed_rows, len(ids)):
+        # Столбец - изменённый рецепт, строка - кандидат на обновление.
+        scores = block_scores(features, block).T
+        rows, columns = np.nonzero(scores > thresholds[:, None])
+        for row, column in zip(rows, columns):
+            candidates.setdefault(int(ids[row]), []).append(
+                (int(ids[block[column]]), float(scores[row, column]))
+            )
+    for chunk in in_chunks(candidates):
+        neighbors = {recipe_id: candidates[recipe_id] for recipe_id in chunk}
+        for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=chunk
+        ).values_list('recipe_id', 'similar_id', 'score'):
+            neighbors[recipe_id].append((similar_id, score))
+        store({
+            recipe_id: sorted(pairs, key=lambda pair: -pair[1])[:top_k]
+            for recipe_id, pairs in neighbors.items()
+        }, computed_at)
+    return len(candidates)
+
+
+def compute_similar(computed_at, top_k=TOP_K, full=False):
+    """Пересчитывает похожие рецепты.
+
+    Без full пересчитываются рецепты, изменённые с прошлого запуска, и
+    те, чьи списки они затронули; остальным изменённые рецепты только
+    подмешиваются. Возвращает словарь со статистикой."""
+    since = None if full else last_run()
+    ids, features = feature_matrix()
+    all_rows = np.arange(len(ids))
+    if since is None:
+        recompute(features, ids, all_rows, top_k, computed_at)
+        return {'recipes': len(ids), 'recomputed': len(ids), 'merged': 0}
+
+    changed_ids = list(Recipe.objects.filter(
+        modified__gte=since
+    ).values_list('pk', flat=True))
+    positions, found = positions_of(ids, changed_ids)
+    changed_rows = positions[found]
+    stale = np.isin(ids, list(affected_recipes(changed_ids, top_k)))
+    stale[changed_rows] = True
+    stale_rows = all_rows[stale]
+    recompute(features, ids, stale_rows, top_k, computed_at)
+    merged = merge_changed(
+        features, ids, changed_rows, stale_rows, top_k, computed_at,
+    ) if len(changed_rows) else 0
+    return {
+        'recipes': len(ids),
+        'changed': len(changed_rows),
+        'recomputed': len(stale_rows),
+        'merged': merged,
+    }
@@ -0,0 +1,62 @@
+"""Общая основа данных, которые держатся в памяти процесса: индекса
+ингредиентов, матрицы пищевой ценности и индекса «что приготовить»."""
+import threading
+import time
+
+from django.db import DatabaseError
+
+from .versions import get_version
+
+
+class ProcessIndex:
+    """Данные в памяти процесса, которые перед чтением сверяются с БД."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Сверяет данные с БД и при необходимости перестраивает их."""
+        raise NotImplementedError
+
+    def warm(self):
+        """Строит данные заранее, например при старте воркера, чтобы
+        первый запрос не ждал сборки."""
+        try:
+            self.refresh()
+        except DatabaseError:
+            # Таблиц ещё нет, например до migrate.
+            pass
+
+
+class VersionedSnapshot(ProcessIndex):
+    """Неизменяемый снимок, который собирается build(version) заново,
+    когда меняется метка version_name. Метка сверяется не чаще раза
+    в check_interval секунд, а не при каждом чтении снимка."""
+    version_name = None
+    check_interval = 2
+
+    def __init__(self):
+        super().__init__()
+        self._snapshot = None
+        self._checked_at = None
+
+    def build(self, version):
+        raise NotImplementedError
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if (snapshot is not None and self._checked_at is not None
+                and now - self._checked_at < self.check_interval):
+            return snapshot
+        version = get_version(self.version_name)
+        self._checked_at = now
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = self.build(version)
+            return self._snapshot
+
+    def refresh(self):
+        self.snapshot()
@@ -0,0 +1,72 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, features
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+executor = (
+    ThreadPoolExecutor(
+        max_workers=settings.THUMBNAIL_WORKERS,
+        thread_name_prefix='thumbnails',
+    )
+    if settings.THUMBNAIL_WORKERS else None
+)
+
+
+def render_thumbnail(source):
+    """Уменьшает картинку и кодирует её в WebP (или JPEG без WebP)."""
+    with Image.open(source) as image:
+        image.thumbnail(settings.THUMBNAIL_SIZE)
+        if features.check('webp'):
+            image_format, extension = 'WEBP', 'webp'
+        else:
+            image_format, extension = 'JPEG', 'jpg'
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, image_format, quality=settings.THUMBNAIL_QUALITY)
+    return buffer.getvalue(), extension
+
+
+def make_thumbnail(recipe_id):
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        if not recipe.image:
+            return
+        with recipe.image.open('rb') as source:
+            content, extension = render_thumbnail(source)
+        name = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        thumbnail = Recipe._meta.get_field('thumbnail')
+        path = thumbnail.storage.save(
+            thumbnail.generate_filename(recipe, f'{name}.{extension}'),
+            ContentFile(content),
+        )
+        Recipe.objects.filter(
+            pk=recipe_id, image=recipe.image.name,
+        ).update(thumbnail=path)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру рецепта %s', recipe_id)
+
+
+def make_thumbnail_in_worker(recipe_id):
+    try:
+        make_thumbnail(recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnail(recipe_id):
+    """Ставит миниатюру в очередь пула после коммита транзакции."""
+    if executor is None:
+        transaction.on_commit(lambda: make_thumbnail(recipe_id))
+    else:
+        transaction.on_commit(
+            lambda: executor.submit(make_thumbnail_in_worker, recipe_id)
+        )
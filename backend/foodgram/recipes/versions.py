@@ -0,0 +1,113 @@
+"""Метки версий данных для ETag, ключей кэша и индексов в памяти.
+
+Метки лежат в таблице DataVersion: их видят все воркеры и management-
+команды, чего не даёт кэш в памяти процесса. С общим кэшем (Redis)
+метки читаются из кэша 'versions', а таблица - только при промахе;
+после коммита новая метка пишется и в таблицу, и в кэш."""
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from .models import DataVersion
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+# Метка данных, которые не менялись с перехода на DataVersion.
+EPOCH = 'epoch'
+BUMP_BATCH_SIZE = 1000
+
+version_cache = caches['versions']
+
+# Метки, уже прочитанные за текущий запрос (api.conditional.
+# VersionMemoMiddleware): ETag, ключ кэша рецепта и индексы в памяти
+# сверяются с одним чтением из кэша или БД.
+current_versions = ContextVar('current_versions', default=None)
+
+
+def recipe_version(pk):
+    return f'recipe:{pk}'
+
+
+def user_version(pk):
+    return f'user:{pk}'
+
+
+def get_versions(*names):
+    """Метки нескольких наборов данных (unix time) одним запросом."""
+    memo = current_versions.get()
+    if memo is None:
+        memo = {}
+    missing = [name for name in names if name not in memo]
+    if missing and not settings.LOCMEM_CACHE:
+        memo.update(version_cache.get_many(missing))
+        missing = [name for name in missing if name not in memo]
+    if missing:
+        found = dict(DataVersion.objects.filter(
+            name__in=[*missing, EPOCH],
+        ).values_list('name', 'stamp'))
+        epoch = found.get(EPOCH, 0.0)
+        loaded = {name: found.get(name, epoch) for name in missing}
+        memo.update(loaded)
+        if not settings.LOCMEM_CACHE:
+            # add, а не set: метку, которую успел записать
+            # flush_pending_versions, прочитанная раньше не затрёт.
+            for name, stamp in loaded.items():
+                version_cache.add(name, stamp)
+    return [memo[name] for name in names]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def flush_pending_versions():
+    names = getattr(connection, 'versions_pending', None)
+    if not names:
+        return
+    connection.versions_pending = set()
+    stamp = time.time()
+    DataVersion.objects.bulk_create(
+        [DataVersion(name=name, stamp=stamp) for name in sorted(names)],
+        batch_size=BUMP_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=('name',),
+        update_fields=('stamp',),
+    )
+    if not settings.LOCMEM_CACHE:
+        version_cache.set_many(dict.fromkeys(names, stamp))
+    memo = current_versions.get()
+    if memo is not None:
+        memo.update(dict.fromkeys(names, stamp))
+
+
+def bump_version(*names):
+    """Сдвигает метки после коммита, чтобы по новой метке не успели
+    закэшировать ещё не закоммиченные данные. Метки за транзакцию
+    пишутся одним запросом."""
+    pending = getattr(connection, 'versions_pending', None)
+    if pending is None:
+        pending = connection.versions_pending = set()
+    pending.update(names)
+    transaction.on_commit(flush_pending_versions)
+
+
+def recipe_payload_key(recipe):
+    """Ключ кэша общей для всех пользователей части рецепта.
+
+    Кроме меток из DataVersion в ключ входит Recipe.modified: он
+    читается вместе с самим рецептом и меняется в той же транзакции,
+    даже если метка после коммита так и не записалась."""
+    versions = ':'.join(
+        str(version) for version in get_versions(
+            recipe_version(recipe.pk), TAGS, INGREDIENTS
+        )
+    )
+    return f'payload:{recipe.pk}:{recipe.modified.timestamp()}:{versions}'
+
+
+def as_datetime(version):
+    return datetime.fromtimestamp(version, tz=timezone.utc)
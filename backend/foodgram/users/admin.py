@@ -4,7 +4,8 @@ from .models import Subscription, User
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('email', 'username',)
+    list_display = ('email', 'username', 'recipes_count',
+                    'subscribers_count',)
     search_fields = ('email', 'username',)
     list_filter = ('email', 'username',)
 
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.2 on 2026-10-17 23:42
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_subscriptions(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    User = apps.get_model('users', 'User')
+    duplicates = Subscription.objects.values(
+        'user', 'author',
+    ).annotate(
+        keep=Min('id'), total=Count('id'),
+    ).filter(total__gt=1).order_by()
+    for row in duplicates:
+        Subscription.objects.filter(
+            user_id=row['user'], author_id=row['author'],
+        ).exclude(id=row['keep']).delete()
+        User.objects.filter(pk=row['author']).update(
+            subscribers_count=Subscription.objects.filter(
+                author_id=row['author'],
+            ).count(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_subscriptions, migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscription'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models
 
 
 USER = 'user'
@@ -33,6 +33,16 @@ class User(AbstractUser):
         choices=ROLES,
         default=USER
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
 
     class Meta:
         ordering = ('username',)
@@ -47,6 +57,66 @@ class User(AbstractUser):
         return self.username
 
 
+class UniquePairQuerySet(models.QuerySet):
+    """Добавление и удаление связей одним запросом.
+
+    Пара полей берётся из уникального ограничения модели: первое -
+    владелец (пользователь), второе - цель (рецепт, автор).
+    INSERT ... ON CONFLICT DO NOTHING и DELETE ... RETURNING возвращают
+    только реально изменённые строки, поэтому exists() не нужен.
+    Сигналы save/delete не отправляются."""
+
+    def pair_sql(self):
+        meta = self.model._meta
+        quote = connections[self.db].ops.quote_name
+        constraint = next(
+            constraint for constraint in meta.constraints
+            if isinstance(constraint, models.UniqueConstraint)
+        )
+        owner, target = (meta.get_field(name) for name in constraint.fields)
+        target_meta = target.related_model._meta
+        return (
+            quote(meta.db_table), quote(owner.column), quote(target.column),
+            quote(target_meta.db_table), quote(target_meta.pk.column),
+        )
+
+    def execute(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def add(self, owner, target_ids):
+        """Связывает owner с существующими целями из target_ids,
+        возвращает id целей, для которых строка добавлена."""
+        target_ids = list(target_ids)
+        if not target_ids:
+            return []
+        table, owner_column, target_column, target_table, target_pk = (
+            self.pair_sql()
+        )
+        return self.execute(
+            f'INSERT INTO {table} ({owner_column}, {target_column}) '
+            f'SELECT %s, {target_pk} FROM {target_table} '
+            f'WHERE {target_pk} IN ({", ".join(["%s"] * len(target_ids))}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target_column}',
+            [owner.pk, *target_ids],
+        )
+
+    def remove(self, owner, target_ids):
+        """Возвращает id целей, связь с которыми была и удалена."""
+        target_ids = list(target_ids)
+        if not target_ids:
+            return []
+        table, owner_column, target_column, *_ = self.pair_sql()
+        return self.execute(
+            f'DELETE FROM {table} WHERE {owner_column} = %s '
+            f'AND {target_column} IN '
+            f'({", ".join(["%s"] * len(target_ids))}) '
+            f'RETURNING {target_column}',
+            [owner.pk, *target_ids],
+        )
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         User,
@@ -61,9 +131,17 @@ class Subscription(models.Model):
         verbose_name='Автор',
     )
 
+    objects = UniquePairQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_subscription',
+            ),
+        )
 
     def __str__(self):
         return f'Подписка {self.user} на {self.author}'
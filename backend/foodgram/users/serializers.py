@@ -1,9 +1,10 @@
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
+from api.fields import ThumbnailImageField
+from api.profiling import ProfiledSerializerMixin
 from recipes.models import Recipe
 from users.models import Subscription
 
@@ -49,7 +50,7 @@ class CustomUserCreateSerializer(UserSerializer):
         return user
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(ProfiledSerializerMixin, UserSerializer):
     """Управляет кастомным юзером."""
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
@@ -67,6 +68,8 @@ class CustomUserSerializer(UserSerializer):
         return value
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -76,14 +79,15 @@ class CustomUserSerializer(UserSerializer):
 
 class SubscrintionShortSerializer(serializers.ModelSerializer):
     """Вывод короткого отображение рецепта в подписках."""
-    image = Base64ImageField(required=False, allow_null=True)
+    image = ThumbnailImageField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time',)
 
 
-class SubscriptionShowSerializer(serializers.ModelSerializer):
+class SubscriptionShowSerializer(ProfiledSerializerMixin,
+                                 serializers.ModelSerializer):
     """ВЫводит авторов на которых подписан юзер и их рецепты"""
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
@@ -110,16 +114,21 @@ class SubscriptionShowSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if obj.user_id == request.user.id:
+            return True
         return Subscription.objects.filter(
             user=request.user, author=obj.author).exists()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj.author)
-        if limit:
-            queryset = queryset[:int(limit)]
+        if 'recipes' in self.context:
+            queryset = self.context['recipes'].get(obj.author_id, ())
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            queryset = Recipe.objects.filter(author=obj.author)
+            if limit:
+                queryset = queryset[:int(limit)]
         return SubscrintionShortSerializer(queryset, many=True).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
@@ -1,4 +1,9 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import Greatest, RowNumber
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import filters
@@ -10,6 +15,8 @@ from rest_framework.response import Response
 
 from api.paginators import CustomPagination
 from api.permissions import IsAdminOrAuthorOrReadOnly
+from recipes.models import FeedItem, Recipe
+from recipes.versions import bump_version, user_version
 from .models import Subscription
 
 from .serializers import CustomUserSerializer
@@ -26,6 +33,17 @@ class CustomUserViewSet(UserViewSet):
     search_fields = ('username',)
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
     pagination_class = CustomPagination
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action not in ('list', 'retrieve') or user.is_anonymous:
+            return queryset
+        # Флаг подписки для всей страницы одним запросом.
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
 
     @action(methods=['patch', 'get'], detail=False, url_path='me',
             permission_classes=[IsAuthenticated],)
@@ -44,49 +62,90 @@ class CustomUserViewSet(UserViewSet):
             permission_classes=[IsAuthenticated],)
     def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, id=id)
 
         if self.request.method == 'POST':
-            if not Subscription.objects.filter(user=user,
-                                               author=author).exists():
-                if user != author:
-                    Subscription.objects.create(
-                        user=request.user,
-                        author=author
-                    )
-                    serializer = CustomUserSerializer(instance=author)
-                    return Response(serializer.data,
-                                    status=status.HTTP_201_CREATED,
-                                    )
+            if str(user.pk) == id:
                 return Response({'errors': 'Вы не можете подписаться на себя'},
                                 status=status.HTTP_400_BAD_REQUEST)
+            if self.toggle(user, int(id), 1):
+                serializer = CustomUserSerializer(
+                    instance=User.objects.get(pk=id)
+                )
+                return Response(serializer.data,
+                                status=status.HTTP_201_CREATED,
+                                )
+            get_object_or_404(User, id=id)
             return Response({'errors': 'Вы уже подписаны на этого автора'},
                             status=status.HTTP_400_BAD_REQUEST
                             )
 
         if self.request.method == 'DELETE':
-            if Subscription.objects.filter(user=user, author=author).exists():
-                Subscription.objects.filter(user=user, author=author).delete()
+            if self.toggle(user, int(id), -1):
                 return Response(
                     {'errors': 'Вы больше не подписаны на этого автора'},
                     status=status.HTTP_201_CREATED,
                 )
+            get_object_or_404(User, id=id)
             return Response({'errors': 'Вы не следите за этим автором'},
                             status=status.HTTP_400_BAD_REQUEST
                             )
 
+    @transaction.atomic
+    def toggle(self, user, author_id, sign):
+        """Подписка или отписка одним запросом; True, если что-то
+        изменилось. Счётчик подписчиков автора обновляется тут же."""
+        if sign > 0:
+            changed = Subscription.objects.add(user, [author_id])
+        else:
+            changed = Subscription.objects.remove(user, [author_id])
+        if changed:
+            User.objects.filter(pk=author_id).update(
+                subscribers_count=Greatest(F('subscribers_count') + sign, 0)
+            )
+            if sign > 0:
+                FeedItem.objects.backfill(user.id, author_id)
+            else:
+                FeedItem.objects.drop(user.id, author_id)
+            # add() и remove() не отправляют сигналы модели.
+            bump_version(user_version(user.id))
+        return bool(changed)
+
     @action(detail=False, methods=('get',),
             permission_classes=[IsAuthenticated],)
     def subscriptions(self, request):
         queryset = Subscription.objects.filter(
             user=request.user
-        ).prefetch_related(
+        ).select_related(
             'author',
-        )
+        ).order_by('-id')
         pages = self.paginate_queryset(queryset)
         serializer = SubscriptionShowSerializer(
             pages,
             many=True,
-            context={'request': request},
+            context={
+                'request': request,
+                'recipes': self.get_recipe_previews(
+                    [subscription.author_id for subscription in pages],
+                    request.query_params.get('recipes_limit'),
+                ),
+            },
         )
         return self.get_paginated_response(serializer.data)
+
+    def get_recipe_previews(self, author_ids, limit):
+        """Последние рецепты всех авторов страницы одним запросом."""
+        recipes = Recipe.objects.filter(author_id__in=author_ids)
+        if limit and limit.isdigit():
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('pub_date').desc(), F('id').desc()),
+                )
+            ).filter(row_number__lte=int(limit))
+        previews = defaultdict(list)
+        for recipe in recipes.only(
+            'id', 'author_id', 'name', 'image', 'thumbnail', 'cooking_time',
+        ).order_by('-pub_date', '-id'):
+            previews[recipe.author_id].append(recipe)
+        return previews